@@ -0,0 +1,611 @@
+"""
+Benchmark suite for the Breakout engine. For each game variant, state
+reporting mode and entity reporting setting, measure the construction time of
+the environment, the duration of `reset`, the throughput of `step` and the
+peak memory used by the environment. The time taken to import the game
+variants in a fresh interpreter is measured as well, since it is paid by
+every worker process. Results are written as JSON, and may be compared
+against a stored baseline to catch performance regressions:
+
+    python -m schema_games.breakout.bench --output baseline.json
+    python -m schema_games.breakout.bench --baseline baseline.json
+
+With --check-hashes, the state hashes of each seeded game variant are also
+checked to be identical in fresh interpreters before benchmarking.
+"""
+
+import Queue
+import argparse
+import inspect
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import traceback
+
+import numpy as np
+
+from schema_games.breakout import games
+from schema_games.breakout.core import BreakoutEngine
+from schema_games.printing import green, red
+
+DEFAULT_NUM_STEPS = 500
+DEFAULT_NUM_RESETS = 5
+DEFAULT_SEED = 0
+DEFAULT_TOLERANCE = 0.1
+DEFAULT_IMPORT_REPEATS = 5
+
+# Seconds between liveness checks of benchmark subprocesses
+_SUBPROCESS_POLL_INTERVAL = 1.0
+
+# Modules whose import time is measured
+IMPORT_MODULES = ('schema_games.breakout.games',)
+
+# Slow dependencies that should only be imported when actually used (e.g.,
+# the viewer when rendering in 'human' mode)
+HEAVY_MODULES = ('matplotlib', 'pyglet', 'OpenGL', 'pygame')
+
+REPORT_NZIS_AS_ENTITIES = ('none', 'edges', 'all')
+RETURN_STATE_AS_IMAGE = (False, True)
+
+# Metrics compared against the baseline, and whether higher is better
+METRICS = (
+    ('construction_time', False),
+    ('reset_time', False),
+    ('steps_per_second', True),
+    ('peak_memory_kb', False),
+)
+IMPORT_METRICS = (
+    ('import_time', False),
+)
+
+# Script measuring the import time of a module in a fresh interpreter
+_IMPORT_SCRIPT = """
+import json, sys, timeit
+sys.path.insert(0, {root!r})
+start = timeit.default_timer()
+import {module}
+import_time = timeit.default_timer() - start
+print json.dumps([import_time,
+                  [name for name in {heavy_modules!r} if name in sys.modules]])
+"""
+
+# Script printing the state hashes of a seeded game in a fresh interpreter,
+# after reset and after each step of a fixed sequence of actions
+_HASH_SCRIPT = """
+import json, sys
+sys.path.insert(0, {root!r})
+from schema_games.breakout import games
+env = games.{game}()
+env.seed({seed})
+env.reset()
+hashes = [env.state_hash()]
+for t in xrange({num_steps}):
+    _, _, done, _ = env.step(env.ACTIONS[t % len(env.ACTIONS)])
+    hashes.append(env.state_hash())
+    if done:
+        break
+print json.dumps(hashes)
+"""
+DEFAULT_HASH_STEPS = 50
+DEFAULT_HASH_INTERPRETERS = 2
+
+
+###############################################################################
+# Benchmarks
+###############################################################################
+
+def get_game_names():
+    """
+    Names of the game variants defined in schema_games.breakout.games.
+
+    Returns
+    -------
+    [str]
+    """
+    return sorted(name for name, obj in vars(games).iteritems()
+                  if inspect.isclass(obj) and
+                  issubclass(obj, BreakoutEngine) and
+                  obj.__module__ == games.__name__)
+
+
+def benchmark_config(game, return_state_as_image, report_nzis_as_entities,
+                     num_steps=DEFAULT_NUM_STEPS,
+                     num_resets=DEFAULT_NUM_RESETS,
+                     seed=DEFAULT_SEED):
+    """
+    Benchmark one configuration of a game variant in the current process.
+
+    Parameters
+    ----------
+    game : str
+        Game variant, specified as a class name in schema_games.breakout.games.
+    return_state_as_image : bool
+    report_nzis_as_entities : str
+        See BreakoutEngine.
+    num_steps : int
+        Number of steps over which throughput is measured. Episodes that end
+        are reset, which does not count towards the step duration.
+    num_resets : int
+        Number of resets over which the reset duration is averaged.
+    seed : int
+        Seed of the environment and of the sequence of actions.
+
+    Returns
+    -------
+    dict
+        Configuration and measurements: 'construction_time' and 'reset_time'
+        in seconds, 'steps_per_second', and 'peak_memory_kb', the increase of
+        the peak resident set size of the process over the benchmark.
+    """
+    actions = np.random.RandomState(seed).randint(len(BreakoutEngine.ACTIONS),
+                                                  size=num_steps)
+    initial_peak_memory = _get_peak_memory_kb()
+
+    start = time.time()
+    env = getattr(games, game)(
+        return_state_as_image=return_state_as_image,
+        report_nzis_as_entities=report_nzis_as_entities)
+    construction_time = time.time() - start
+    env.seed(seed)
+
+    start = time.time()
+    for _ in xrange(num_resets):
+        env.reset()
+    reset_time = (time.time() - start) / num_resets
+
+    step_time = 0.
+    for action in actions:
+        start = time.time()
+        _, _, done, _ = env.step(action)
+        step_time += time.time() - start
+
+        if done:
+            env.reset()
+
+    return {
+        'game': game,
+        'return_state_as_image': return_state_as_image,
+        'report_nzis_as_entities': report_nzis_as_entities,
+        'construction_time': construction_time,
+        'reset_time': reset_time,
+        'steps_per_second': num_steps / step_time,
+        'peak_memory_kb': _get_peak_memory_kb() - initial_peak_memory,
+    }
+
+
+def benchmark_import(module, num_repeats=DEFAULT_IMPORT_REPEATS):
+    """
+    Benchmark the import of a module, each time in a fresh interpreter.
+
+    Parameters
+    ----------
+    module : str
+        Fully qualified name of the module.
+    num_repeats : int
+        Number of interpreters in which the import is timed.
+
+    Returns
+    -------
+    dict
+        Module, best import time over all repeats in seconds under
+        'import_time', and the heavy modules (see HEAVY_MODULES) that were
+        imported along with it under 'heavy_modules'.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+    script = _IMPORT_SCRIPT.format(root=root, module=module,
+                                   heavy_modules=HEAVY_MODULES)
+    import_times = []
+
+    for _ in xrange(num_repeats):
+        output = subprocess.check_output([sys.executable, '-c', script])
+        import_time, heavy_modules = json.loads(output.splitlines()[-1])
+        import_times.append(import_time)
+
+    return {
+        'module': module,
+        'import_time': min(import_times),
+        'heavy_modules': heavy_modules,
+    }
+
+
+def check_state_hash(game, seed=DEFAULT_SEED, num_steps=DEFAULT_HASH_STEPS,
+                     num_interpreters=DEFAULT_HASH_INTERPRETERS):
+    """
+    Check that the state hashes of a seeded game (see
+    `BreakoutEngine.state_hash`) are the same in several fresh interpreters,
+    so that they can be shared across processes, e.g. by rollout workers.
+
+    Parameters
+    ----------
+    game : str
+        Game variant, specified as a class name in schema_games.breakout.games.
+    seed : int
+        Seed of the environment.
+    num_steps : int
+        Number of steps after which hashes are compared, in addition to the
+        initial state.
+    num_interpreters : int
+        Number of interpreters in which hashes are computed.
+
+    Returns
+    -------
+    bool
+        True if all the interpreters produced the same hashes.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+    script = _HASH_SCRIPT.format(root=root, game=game, seed=seed,
+                                 num_steps=num_steps)
+    hashes = [json.loads(subprocess.check_output(
+                  [sys.executable, '-c', script]).splitlines()[-1])
+              for _ in xrange(num_interpreters)]
+
+    return all(other == hashes[0] for other in hashes[1:])
+
+
+def run_benchmarks(game_names=None,
+                   num_steps=DEFAULT_NUM_STEPS,
+                   num_resets=DEFAULT_NUM_RESETS,
+                   seed=DEFAULT_SEED,
+                   import_modules=IMPORT_MODULES,
+                   verbose=True):
+    """
+    Benchmark all the configurations of a set of game variants. Each
+    configuration runs in a fresh process, so that memory measurements and
+    timings do not depend on the configurations benchmarked before it.
+
+    Parameters
+    ----------
+    game_names : [str] or None
+        Game variants to benchmark. Defaults to all the variants.
+    num_steps : int
+    num_resets : int
+    seed : int
+        See `benchmark_config`.
+    import_modules : [str]
+        Modules whose import time is measured (see `benchmark_import`).
+    verbose : bool
+        If True, print the results as they come.
+
+    Returns
+    -------
+    dict
+        Benchmark metadata under 'meta', the results of each configuration
+        (see `benchmark_config`) under 'results', and those of each import
+        (see `benchmark_import`) under 'imports'.
+    """
+    game_names = get_game_names() if game_names is None else game_names
+    results = []
+    imports = []
+
+    for module in import_modules:
+        result = benchmark_import(module)
+        imports.append(result)
+
+        if verbose:
+            print format_import_result(result)
+
+    for game in game_names:
+        for return_state_as_image in RETURN_STATE_AS_IMAGE:
+            for report_nzis_as_entities in REPORT_NZIS_AS_ENTITIES:
+                result = _run_in_subprocess(
+                    benchmark_config,
+                    game, return_state_as_image, report_nzis_as_entities,
+                    num_steps=num_steps, num_resets=num_resets, seed=seed)
+
+                results.append(result)
+
+                if verbose:
+                    print format_result(result)
+
+    meta = {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'num_steps': num_steps,
+        'num_resets': num_resets,
+        'seed': seed,
+    }
+
+    return {'meta': meta, 'results': results, 'imports': imports}
+
+
+###############################################################################
+# Reporting
+###############################################################################
+
+def format_result(result):
+    """
+    One-line summary of the result of a configuration.
+    """
+    return ("{} {:<24s} {:<6s} {:<5s} | init {:7.1f}ms | reset {:7.1f}ms | "
+            "{:8.0f} steps/s | {:7d}kB").format(
+                ' ' if result.get('regressions') is None else
+                red('!') if result['regressions'] else green('='),
+                result['game'],
+                'image' if result['return_state_as_image'] else 'state',
+                result['report_nzis_as_entities'],
+                result['construction_time'] * 1e3,
+                result['reset_time'] * 1e3,
+                result['steps_per_second'],
+                result['peak_memory_kb'])
+
+
+def format_import_result(result):
+    """
+    One-line summary of the result of an import.
+    """
+    return "{} {:<37s} | import {:7.1f}ms | heavy modules: {}".format(
+        ' ' if result.get('regressions') is None else
+        red('!') if result['regressions'] else green('='),
+        result['module'],
+        result['import_time'] * 1e3,
+        ', '.join(result['heavy_modules']) or 'none')
+
+
+def compare_to_baseline(benchmark, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compare benchmark results against a baseline.
+
+    Parameters
+    ----------
+    benchmark : dict
+        Output of `run_benchmarks`.
+    baseline : dict
+        Output of `run_benchmarks`, typically loaded from a JSON file.
+    tolerance : float
+        Relative change beyond which a metric is reported as a regression.
+
+    Returns
+    -------
+    [dict]
+        Results of the configurations present in the baseline, each with the
+        ratios of its metrics to the baseline under 'ratios', and the list of
+        regressed metrics under 'regressions'.
+    """
+    def key(result):
+        return (result['game'], result['return_state_as_image'],
+                result['report_nzis_as_entities'])
+
+    return _compare_results(benchmark['results'], baseline['results'], key,
+                            METRICS, tolerance)
+
+
+def compare_imports_to_baseline(benchmark, baseline,
+                                tolerance=DEFAULT_TOLERANCE):
+    """
+    Compare import benchmark results against a baseline.
+
+    Parameters
+    ----------
+    benchmark : dict
+    baseline : dict
+    tolerance : float
+        See `compare_to_baseline`.
+
+    Returns
+    -------
+    [dict]
+        Results of the imports present in the baseline, with ratios and
+        regressions as in `compare_to_baseline`.
+    """
+    def key(result):
+        return result['module']
+
+    return _compare_results(benchmark.get('imports', []),
+                            baseline.get('imports', []), key,
+                            IMPORT_METRICS, tolerance)
+
+
+def _compare_results(results, baseline_results, key, metrics, tolerance):
+    """
+    Compare results to those of the baseline with the same key.
+    """
+    baseline_results = {key(result): result for result in baseline_results}
+    comparison = []
+
+    for result in results:
+        reference = baseline_results.get(key(result))
+        if reference is None:
+            continue
+
+        result = dict(result, ratios={}, regressions=[])
+
+        for metric, higher_is_better in metrics:
+            if not reference[metric]:
+                continue
+
+            ratio = float(result[metric]) / reference[metric]
+            result['ratios'][metric] = ratio
+
+            if higher_is_better and ratio < 1 - tolerance or \
+               not higher_is_better and ratio > 1 + tolerance:
+                result['regressions'].append(metric)
+
+        comparison.append(result)
+
+    return comparison
+
+
+def _run_in_subprocess(function, *args, **kwargs):
+    """
+    Call a function in a forked process and return its result.
+    """
+    queue = multiprocessing.Queue()
+
+    def target():
+        try:
+            queue.put((True, function(*args, **kwargs)))
+        except Exception:
+            queue.put((False, traceback.format_exc()))
+
+    process = multiprocessing.Process(target=target)
+    process.start()
+
+    # The child may die without reporting anything (e.g., segfault, OOM kill,
+    # or SystemExit), in which case waiting on the queue would hang forever.
+    while True:
+        try:
+            success, result = queue.get(timeout=_SUBPROCESS_POLL_INTERVAL)
+            break
+        except Queue.Empty:
+            if process.is_alive():
+                continue
+
+        # The child may have exited right after reporting its result
+        try:
+            success, result = queue.get(timeout=_SUBPROCESS_POLL_INTERVAL)
+            break
+        except Queue.Empty:
+            process.join()
+            raise RuntimeError(
+                "Benchmark subprocess died without reporting a result "
+                "(exit code {})".format(process.exitcode))
+
+    process.join()
+
+    if not success:
+        raise RuntimeError("Benchmark failed in subprocess:\n" + result)
+
+    return result
+
+
+def _get_peak_memory_kb():
+    """
+    Peak resident set size of the current process, in kilobytes.
+    """
+    peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Reported in bytes on macOS, in kilobytes on Linux
+    if sys.platform == 'darwin':
+        peak_memory //= 1024
+
+    return peak_memory
+
+
+if __name__ == '__main__':
+    """
+    Command line interface.
+    """
+    parser = argparse.ArgumentParser(
+        description='Benchmark the breakout game variants.',
+        usage='bench.py [--games <Game> ...] [--steps N] [--output FILE] '
+              '[--baseline FILE] [--check-hashes]')
+
+    parser.add_argument(
+        '--games',
+        dest='games',
+        nargs='+',
+        default=None,
+        help="Game variants specified as class names (default: all)."
+    )
+
+    parser.add_argument(
+        '--steps',
+        dest='num_steps',
+        default=DEFAULT_NUM_STEPS,
+        type=int,
+        help="Number of steps over which throughput is measured."
+    )
+
+    parser.add_argument(
+        '--resets',
+        dest='num_resets',
+        default=DEFAULT_NUM_RESETS,
+        type=int,
+        help="Number of resets over which reset duration is averaged."
+    )
+
+    parser.add_argument(
+        '--seed',
+        dest='seed',
+        default=DEFAULT_SEED,
+        type=int,
+        help="Seed of the random number generators."
+    )
+
+    parser.add_argument(
+        '--output',
+        dest='output',
+        default=None,
+        help="Write the results to this JSON file."
+    )
+
+    parser.add_argument(
+        '--baseline',
+        dest='baseline',
+        default=None,
+        help="Compare the results to those stored in this JSON file."
+    )
+
+    parser.add_argument(
+        '--tolerance',
+        dest='tolerance',
+        default=DEFAULT_TOLERANCE,
+        type=float,
+        help="Relative change beyond which a metric is a regression."
+    )
+
+    parser.add_argument(
+        '--check-hashes',
+        dest='check_hashes',
+        action='store_true',
+        help="Also check that state hashes match across interpreters."
+    )
+
+    args = parser.parse_args()
+
+    if args.check_hashes:
+        game_names = get_game_names() if args.games is None else args.games
+        unstable = [game for game in game_names
+                    if not check_state_hash(game, seed=args.seed)]
+
+        for game in game_names:
+            if game in unstable:
+                print red("{:<40s} state hashes differ across "
+                          "interpreters".format(game))
+            else:
+                print green("{:<40s} state hashes match across "
+                            "interpreters".format(game))
+
+        if unstable:
+            sys.exit(1)
+
+    benchmark = run_benchmarks(args.games,
+                               num_steps=args.num_steps,
+                               num_resets=args.num_resets,
+                               seed=args.seed)
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(benchmark, f, indent=2, sort_keys=True)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+        comparison = compare_to_baseline(benchmark, baseline, args.tolerance)
+        import_comparison = compare_imports_to_baseline(
+            benchmark, baseline, args.tolerance)
+
+        print
+        print "Comparison to baseline {}:".format(args.baseline)
+        for result in import_comparison:
+            print format_import_result(result), ' '.join(
+                '{}={:.2f}'.format(metric, ratio)
+                for metric, ratio in sorted(result['ratios'].iteritems()))
+
+        for result in comparison:
+            print format_result(result), ' '.join(
+                '{}={:.2f}'.format(metric, ratio)
+                for metric, ratio in sorted(result['ratios'].iteritems()))
+
+        if any(result['regressions']
+               for result in comparison + import_comparison):
+            sys.exit(1)
@@ -0,0 +1,134 @@
+"""
+Bookkeeping of the bricks present in a game. Bricks are destroyed one at a
+time while the engine keeps iterating over the remaining ones and checking
+whether any brick yielding a positive reward is left; with large layouts,
+removing bricks from a plain list and scanning it at each timestep costs
+O(bricks) several times per step. The store below removes bricks in constant
+time and keeps track of the remaining positive-reward bricks as they are
+removed or their rewards change.
+"""
+
+
+class BrickStore(object):
+    """
+    Set of bricks with constant-time removal, which preserves the order in
+    which bricks were added.
+
+    Bricks are kept in slots with stable indices: removing a brick empties its
+    slot, and the list of remaining bricks is rebuilt (and the slots
+    compacted) only when it is next requested. The store registers itself as
+    an observer of each brick, so that reward changes (e.g., when a layout
+    reassigns rewards after creating its bricks) are reflected in the set of
+    positive-reward bricks.
+
+    Parameters
+    ----------
+    bricks : [Brick]
+        Initial bricks.
+    """
+    def __init__(self, bricks=()):
+        self._slots = []        # brick or None, in order of addition
+        self._slot_of = {}      # brick -> index of its slot
+        self._good_bricks = set()
+        self._bricks = ()       # remaining bricks, or None if outdated
+
+        for brick in bricks:
+            self.add(brick)
+
+    def __contains__(self, brick):
+        return brick in self._slot_of
+
+    def __len__(self):
+        return len(self._slot_of)
+
+    def __iter__(self):
+        return iter(self.bricks)
+
+    @property
+    def bricks(self):
+        """
+        Remaining bricks, in order of addition. The tuple is shared until the
+        next change of the store.
+
+        Returns
+        -------
+        (Brick,)
+        """
+        if self._bricks is None:
+            self._slots = [brick for brick in self._slots
+                           if brick is not None]
+            self._slot_of = {brick: i for i, brick in enumerate(self._slots)}
+            self._bricks = tuple(self._slots)
+
+        return self._bricks
+
+    @property
+    def num_good_bricks(self):
+        """
+        Number of remaining bricks yielding a strictly positive reward.
+        """
+        return len(self._good_bricks)
+
+    def add(self, brick):
+        """
+        Add a brick after the existing ones.
+
+        Parameters
+        ----------
+        brick : Brick
+        """
+        if brick in self._slot_of:
+            return
+
+        self._slot_of[brick] = len(self._slots)
+        self._slots.append(brick)
+        self._bricks = None
+
+        if brick.reward > 0:
+            self._good_bricks.add(brick)
+        brick.register(self)
+
+    def remove(self, brick):
+        """
+        Remove a brick in constant time.
+
+        Parameters
+        ----------
+        brick : Brick
+        """
+        self._slots[self._slot_of.pop(brick)] = None
+        self._bricks = None
+
+        self._good_bricks.discard(brick)
+        brick.unregister(self)
+
+    def clear(self):
+        """
+        Remove all the bricks.
+        """
+        for brick in self._slot_of:
+            brick.unregister(self)
+
+        self._slots = []
+        self._slot_of = {}
+        self._good_bricks.clear()
+        self._bricks = ()
+
+    def update(self, brick, attribute):
+        """
+        Observer callback, called by bricks whenever one of their attributes
+        changes. Keeps track of the bricks yielding a positive reward.
+
+        Parameters
+        ----------
+        brick : Brick
+        attribute : str
+            Name of the attribute that changed.
+        """
+        if attribute != 'reward':
+            return
+
+        if brick.reward > 0:
+            self._good_bricks.add(brick)
+        else:
+            self._good_bricks.discard(brick)
@@ -24,6 +24,20 @@ _BALL_SHAPE = np.array([1, 1])
 ###############################################################################
 MAX_NZIS_PER_ENTITY = 100
 
+###############################################################################
+# Record type of the compact, array-backed entity states: entity ID, position
+# (row, column), relative position within the object's shape and color index
+# in the engine's `standard_color_map`.
+###############################################################################
+ENTITY_STATE_DTYPE = np.dtype([
+    ('eid', np.int32),
+    ('row', np.int16),
+    ('col', np.int16),
+    ('du', np.int16),
+    ('dv', np.int16),
+    ('color', np.int16),
+])
+
 ALLOW_BOUNCE_AGAINST_PHYSICS = False
 BOUNCE_STOCHASTICITY = 0.25
 CORRUPT_RENDERED_IMAGE = False
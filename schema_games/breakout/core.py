@@ -1,25 +1,33 @@
 import copy
 import numpy as np
-import random
 import warnings
-from itertools import product
+from collections import Mapping, namedtuple
+from itertools import count, product
 
 import gym
-from gym.envs.classic_control import rendering
+import gym.spaces
+from gym.utils import seeding
 
 from schema_games.printing import red, blue, yellow, green, cyan, purple
-from schema_games.utils import blockedrange, offset_nzis_from_position
+from schema_games.utils import blockedrange
 from schema_games.breakout.objects import \
-    BreakoutObject, Ball, Paddle, Wall, \
+    BreakoutObject, AcceleratorBrick, Ball, Paddle, Wall, \
     PaddleShrinkingWall, WallOfPunishment, MoveableObject, MomentumObject
+from schema_games.breakout.brickstore import BrickStore
+from schema_games.breakout.framebuffer import Framebuffer, StaticLayer
+from schema_games.breakout.hashing import StateHash, combine_keys
+from schema_games.breakout.occupancy import OccupancyGrid
+from schema_games.breakout.profiling import NULL_SECTION, StepProfiler
+from schema_games.breakout.sampling import DiscreteSampler, UniformSampler
 from schema_games.breakout.constants import \
     _MAX_SPEED, ALLOW_BOUNCE_AGAINST_PHYSICS, CLASSIC_BACKGROUND_COLOR, \
     BOUNCE_STOCHASTICITY, CORRUPT_RENDERED_IMAGE, DEBUGGING, \
     DEFAULT_HEIGHT, DEFAULT_PADDLE_SHAPE, DEFAULT_WALL_THICKNESS, \
-    DEFAULT_WIDTH, EXCLUDED_VELOCITIES, NUM_BALLS, NUM_LIVES, PADDLE_SPEED, \
-    PADDLE_SPEED_DISTRIBUTION, PADDLE_STARTING_POSITION, \
-    REWARD_UPON_BALL_LOSS, REWARD_UPON_NO_BRICKS_LEFT, \
-    STARTING_BALL_MOVEMENT_RADIUS
+    DEFAULT_WIDTH, ENTITY_STATE_DTYPE, EXCLUDED_VELOCITIES, \
+    MAX_NZIS_PER_ENTITY, NUM_BALLS, \
+    NUM_LIVES, PADDLE_SPEED, PADDLE_SPEED_DISTRIBUTION, \
+    PADDLE_STARTING_POSITION, REWARD_UPON_BALL_LOSS, \
+    REWARD_UPON_NO_BRICKS_LEFT, STARTING_BALL_MOVEMENT_RADIUS
 
 
 class ResetHasNeverBeenCalledError(RuntimeError):
@@ -29,6 +37,71 @@ class ResetHasNeverBeenCalledError(RuntimeError):
     pass
 
 
+class StaleDebugInfoError(RuntimeError):
+    """
+    Raised when a lazily computed value of the debug information is first
+    accessed after the game has moved on from the timestep it describes.
+    """
+    pass
+
+
+class LazyDebugInfo(Mapping):
+    """
+    Read-only mapping of debug information, whose values are only computed
+    on first access. Values describe the game at the timestep the mapping was
+    returned, so they can only be computed until the environment moves on
+    (see `invalidate`); values accessed before then remain available.
+
+    Parameters
+    ----------
+    functions : {str: callable}
+        Function computing each value, called without arguments.
+    """
+    def __init__(self, functions):
+        self._functions = functions
+        self._values = {}
+        self._valid = True
+
+    def invalidate(self):
+        """
+        Called by the environment when the game moves on.
+        """
+        self._valid = False
+
+    def __getitem__(self, key):
+        if key not in self._values:
+            function = self._functions[key]
+
+            if not self._valid:
+                raise StaleDebugInfoError(
+                    "'{}' must be accessed before the environment is stepped, "
+                    "reset or restored again".format(key))
+
+            self._values[key] = function()
+
+        return self._values[key]
+
+    def __iter__(self):
+        return iter(self._functions)
+
+    def __len__(self):
+        return len(self._functions)
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, sorted(self._functions))
+
+
+# Lookup tables of ball velocities for a given ball movement radius, see
+# `BreakoutEngine.velocity_tables`
+VelocityTables = namedtuple('VelocityTables', [
+    'index_to_velocity',      # {int: (int, int)}
+    'velocity_to_index',      # {(int, int): int}
+    'indices',                # [int], all velocity indices
+    'same_quadrant_indices',  # {int: [int]}, indices of the velocities in
+                              # the same quadrant as that of each index
+])
+
+
 ###############################################################################
 # Game environment
 ###############################################################################
@@ -55,6 +128,7 @@ class BreakoutEngine(gym.Env):
                  num_lives=NUM_LIVES,
                  wall_thickness=DEFAULT_WALL_THICKNESS,
                  debugging=DEBUGGING,
+                 profiling=False,
 
                  # -- ball parameters --
                  num_balls=NUM_BALLS,
@@ -79,6 +153,11 @@ class BreakoutEngine(gym.Env):
                  report_outer_walls_as_entities=False,
                  bottom_wall_of_punishment=True,
                  return_state_as_image=False,
+                 entity_state_format='dict',
+                 entity_states_in_debug_info='lazy',
+                 frameskip=1,
+                 max_pool_frames=False,
+                 rendering_mode='full',
                  ):
         """
         General Parameters
@@ -94,6 +173,10 @@ class BreakoutEngine(gym.Env):
         debugging : bool
             If True, print a bunch of debugging messages, and perform more
             double-checking assertions.
+        profiling : bool
+            If True, accumulate the wall time spent in each phase of `_step`
+            (see `get_profiling_stats`). May also be toggled later with
+            `enable_profiling`.
 
         Ball Parameters
         ---------------
@@ -159,6 +242,37 @@ class BreakoutEngine(gym.Env):
         return_state_as_image : bool
             If True, the state returned as every step is the image of the game.
             Otherwise, it's a sparsified form of the image (states dictionary).
+        entity_state_format : str
+            If 'dict', entity states are reported as dictionaries (see
+            `get_entity_states`). If 'array', they are reported as a compact
+            NumPy structured array instead (see `get_entity_array`).
+        entity_states_in_debug_info : str
+            How entity states are reported in the debug information returned
+            by `step` when the state is the image of the game (otherwise they
+            are the state, and always reported). If 'always', they are
+            computed at every step. If 'lazy', they are only computed when
+            `debug_info['entity_states']` is first accessed, which must happen
+            before the environment is stepped again (see `LazyDebugInfo`). If
+            'never', they are not reported.
+        frameskip : int
+            Number of timesteps played at every call of `step`, repeating the
+            action. Rewards are summed over these timesteps, and only the
+            observation of the last one is built.
+        max_pool_frames : bool
+            If True, the observation returned by `step` is the pixel-wise
+            maximum of the images of the last two timesteps played, which
+            removes flickering between frames. If the game ends before the
+            last two timesteps, the image of the last timestep played is
+            returned instead. Requires image observations.
+        rendering_mode : str
+            If 'full' (the default), every object is painted anew whenever
+            the game is rendered. If 'dirty_rectangles', the image of the
+            previous frame is kept and only the regions that objects entered
+            or vacated since then are repainted, which makes rendering much
+            cheaper. If 'static_layer', walls, bricks and fixed obstacles are
+            cached in a pre-rendered layer, which is only rebuilt when one of
+            them changes or disappears, and the moving objects are painted on
+            top of it.
         """
 
         self.width = width
@@ -180,9 +294,25 @@ class BreakoutEngine(gym.Env):
         self.report_outer_walls_as_entities = report_outer_walls_as_entities
         self.bottom_wall_of_punishment = bottom_wall_of_punishment
         self.return_state_as_image = return_state_as_image
+        self.entity_state_format = entity_state_format
+        self.entity_states_in_debug_info = entity_states_in_debug_info
+        self.frameskip = frameskip
+        self.max_pool_frames = max_pool_frames
+        self.rendering_mode = rendering_mode
         self.debugging = debugging
+        self.profiling_stats = StepProfiler()
+        self.profiler = self.profiling_stats if profiling else None
         self.reset_has_never_been_called = True
 
+        # Random number generator of the environment, see `_seed`. The
+        # variates drawn at every timestep (paddle noise, bounces) are drawn
+        # from it by blocks.
+        self.np_random = None
+        self.paddle_speed_sampler = DiscreteSampler(
+            range(-paddle_speed, paddle_speed + 1), paddle_speed_distribution)
+        self.uniform_sampler = UniformSampler()
+        self._seed()
+
         # Gym-specific attributes
         #####################################################################
         self.observation_space = gym.spaces.Box(
@@ -206,8 +336,14 @@ class BreakoutEngine(gym.Env):
         # Special attributes
         #####################################################################
         self.walls = []
+        self._brick_store = BrickStore()
+        self.occupancy = None
+        self.state_hasher = None
+        self.framebuffer = None
+        self._lazy_debug_info = None
         self.conditional_events = []
-        self._memoized_index_to_velocity = {}
+        self._memoized_velocity_tables = {}
+        self._memoized_paddle_response_functions = {}
         self.excluded_velocities = frozenset(excluded_velocities)
 
         # Sanity checks
@@ -218,6 +354,12 @@ class BreakoutEngine(gym.Env):
             assert 0 <= abs(velocity[1]) <= _MAX_SPEED
 
         assert self.report_nzis_as_entities in ('all', 'edges', 'none')
+        assert self.entity_state_format in ('dict', 'array')
+        assert self.entity_states_in_debug_info in ('always', 'lazy', 'never')
+        assert self.frameskip >= 1
+        assert not self.max_pool_frames or self.return_state_as_image
+        assert self.rendering_mode in ('full', 'dirty_rectangles',
+                                       'static_layer')
         assert len(self.paddle_speed_distribution) == 2 * self.paddle_speed + 1
         assert np.isclose(np.sum(self.paddle_speed_distribution), 1.0)
         assert 0 <= self.bounce_stochasticity <= 1
@@ -229,32 +371,70 @@ class BreakoutEngine(gym.Env):
 
         # Environment border walls: not really customizable by default
         #######################################################################
+        #
+        #  Each border is a single rectangular wall, whose pixels are reported
+        #  as separate entities, as though the border was made of one-pixel
+        #  walls. Entity IDs are allocated in the same order as they would be
+        #  for one-pixel walls, so that reported entities do not depend on
+        #  this representation.
+        #
+        thickness = self.wall_thickness
+        entity_ids = count(BreakoutObject.unique_entity_id,
+                           MAX_NZIS_PER_ENTITY)
+        left, right, top, bottom = {}, {}, {}, {}
+
         for y in range(self.height):
-            for w in range(self.wall_thickness):
-                is_entity = ((w == self.wall_thickness - 1 and
-                              y <= self.height - self.wall_thickness) or
+            for w in range(thickness):
+                is_entity = ((w == thickness - 1 and
+                              y <= self.height - thickness) or
                              self.report_outer_walls_as_entities)
 
-                self.walls += [Wall((w, y), is_entity=is_entity),
-                               Wall((self.width-w-1, y), is_entity=is_entity)]
+                if is_entity:
+                    left[(w, y)] = next(entity_ids)
+                    right[(thickness - w - 1, y)] = next(entity_ids)
 
         for x in range(self.width):
-            for w in range(self.wall_thickness):
-                is_entity = ((w == self.wall_thickness - 1 and
-                              x >= self.wall_thickness - 1 and
-                              x <= self.width - self.wall_thickness) or
+            for w in range(thickness):
+                is_entity = ((w == thickness - 1 and
+                              x >= thickness - 1 and
+                              x <= self.width - thickness) or
                              self.report_outer_walls_as_entities)
 
-                self.walls += [PaddleShrinkingWall((x, self.height-w-1),
-                                                   is_entity=is_entity)]
+                if is_entity:
+                    top[(x, thickness - w - 1)] = next(entity_ids)
                 if self.bottom_wall_of_punishment:
-                    self.walls += [WallOfPunishment((x, w), is_entity=True)]
+                    bottom[(x, w)] = next(entity_ids)
+
+        BreakoutObject.unique_entity_id = next(entity_ids)
+
+        self.walls += [
+            Wall((0, 0),
+                 shape=(thickness, self.height),
+                 pixel_entities=left),
+            Wall((self.width - thickness, 0),
+                 shape=(thickness, self.height),
+                 pixel_entities=right),
+            PaddleShrinkingWall((0, self.height - thickness),
+                                shape=(self.width, thickness),
+                                pixel_entities=top),
+        ]
+
+        if self.bottom_wall_of_punishment:
+            self.walls += [WallOfPunishment((0, 0),
+                                            shape=(self.width, thickness),
+                                            pixel_entities=bottom)]
 
     ###########################################################################
     # API methods: Gym API methods + our `layout` method
     ###########################################################################
 
     def _render(self, mode='human', close=False):
+        if close:
+            if self.viewer is not None:
+                self.viewer.close()
+                self.viewer = None
+            return
+
         if self.reset_has_never_been_called:
             raise ResetHasNeverBeenCalledError
 
@@ -263,10 +443,39 @@ class BreakoutEngine(gym.Env):
 
         elif mode == 'human':
             if self.viewer is None:
+                # Imported here rather than at module level: the viewer pulls
+                # in pyglet and OpenGL, which headless processes never need
+                # (and which fail to import without a display).
+                from gym.envs.classic_control import rendering
                 self.viewer = rendering.SimpleImageViewer()
 
             self.viewer.imshow(self._get_image())
 
+    def _seed(self, seed=None):
+        """
+        Seed the random number generator of the environment, from which all
+        the random draws of the game are made (layouts, ball and paddle
+        placement, bounces, paddle motion), so that environments running
+        side by side are independent and each of them is reproducible.
+
+        Parameters
+        ----------
+        seed : int or None
+            Non-negative seed. If None, a random seed is used.
+
+        Returns
+        -------
+        seeds : [int]
+            Seed actually used.
+        """
+        self.np_random, seed = seeding.np_random(seed)
+
+        # Variates drawn from the previous generator are discarded
+        self.paddle_speed_sampler.clear()
+        self.uniform_sampler.clear()
+
+        return [seed]
+
     def _reset(self):
         """
         Resets the bricks and ball to start a new game.
@@ -279,9 +488,25 @@ class BreakoutEngine(gym.Env):
             Contains useful information about the environment for debugging
             purposes only.
         """
+        self.invalidate_debug_info()
+
         for attribute, initial_value in self.reset_mutables.iteritems():
             setattr(self, attribute, initial_value)
 
+        # The occupancy grid and framebuffer are rebuilt once the new layout
+        # is set up
+        if self.occupancy is not None:
+            self.occupancy.clear()
+            self.occupancy = None
+
+        if self.state_hasher is not None:
+            self.state_hasher.clear()
+            self.state_hasher = None
+
+        if self.framebuffer is not None:
+            self.framebuffer.clear()
+            self.framebuffer = None
+
         # Set up game objects (balls and paddle: position/velocity do not
         # matter, will be reset below).
         #######################################################################
@@ -300,11 +525,24 @@ class BreakoutEngine(gym.Env):
         self.layout_sanity_check()
         self.randomize_paddle_position()
         self.randomize_ball_position_and_velocity()
+        self.occupancy = self.build_occupancy_grid()
+        self.state_hasher = self.build_state_hasher()
+
+        if self.rendering_mode == 'dirty_rectangles':
+            self.framebuffer = Framebuffer(self.get_background_image())
+        elif self.rendering_mode == 'static_layer':
+            self.framebuffer = StaticLayer(self.get_background_image(),
+                                           self.render_object)
 
         # Build unique mapping of color -> ID at the beginning of the game
         unique_colors = {obj.color for obj in self.objects}
         self.standard_color_map = {c: i for i, c in enumerate(unique_colors)}
 
+        # Objects kept across games (e.g., border walls) may have cached
+        # entity states whose color indices refer to the previous color map
+        for obj in self.objects:
+            obj.reset_cache()
+
         if self.debugging:
             print blue("Detected the following unique "
                        "colors: {}".format(self.standard_color_map))
@@ -315,10 +553,7 @@ class BreakoutEngine(gym.Env):
         self.reward = None  # reward at current timestep
 
         # Initially observed state
-        if self.return_state_as_image:
-            state = self._get_image()
-        else:
-            state = self.get_entity_states()
+        state = self.get_observation()
 
         self.reset_has_never_been_called = False
 
@@ -329,19 +564,21 @@ class BreakoutEngine(gym.Env):
         Parameters
         ----------
         action : int
-            The action to perform.
+            The action to perform, repeated for `frameskip` timesteps.
 
         Returns
         -------
         observation : np.array
             The current image of the environment.
         reward : float
-            The reward received from the current action-state pair.
+            The reward received from the current action-state pair, summed
+            over the timesteps played.
         done : bool
             Indicates whether the environment has reached a termination state.
-        debug_info : dict
+        debug_info : dict or LazyDebugInfo
             Contains useful information about the environment for debugging
-            purposes only. Not used for training or evaluation.
+            purposes only. Not used for training or evaluation. See
+            `get_debug_info`.
         """
         if self.reset_has_never_been_called:
             raise ResetHasNeverBeenCalledError
@@ -349,20 +586,63 @@ class BreakoutEngine(gym.Env):
         if not self.action_space.contains(action):
             raise ValueError("Invalid action: {}".format(action))
 
-        self.reward = 0
+        # Only the frames making up the observation are rendered: the last
+        # one, and the one before if frames are max-pooled. Single timesteps
+        # are never fast-forwarded, so that each of them goes through every
+        # phase below (and is profiled as such).
+        frames = None
+        fast_forward = self.frameskip > 1
 
-        # Important: reset at every time step!
-        self.hit_objects = set()
+        if self.max_pool_frames and self.frameskip > 1:
+            reward, done, _, _ = self._play(action, self.frameskip - 2)
 
-        # Invalid value to make sure it is set before step() returns!
-        self.done = None
+            if not done:
+                frames = []
+                last_reward, done, _, _ = self._play(action, 2, frames)
+                reward += last_reward
+        else:
+            reward, done, _, _ = self._play(action, self.frameskip,
+                                            fast_forward=fast_forward)
 
-        self.debugprint_header()
+        debug_info = self.get_debug_info()
+
+        if frames:
+            with self.profile('image'):
+                state = np.maximum(frames[0], frames[-1])
+        elif self.return_state_as_image:
+            with self.profile('image'):
+                state = self._get_image()
+        else:
+            state = debug_info['entity_states']
+
+        return state, reward, done, debug_info
+
+    def _play_timestep(self, action):
+        """
+        Play a single timestep of the game, without building any observation.
+
+        Parameters
+        ----------
+        action : int
+            The action to perform.
+
+        Mutates
+        -------
+        self.reward : int or float
+            Reward at this timestep.
+        self.done : bool
+            Is the game over?
+        """
+        self._begin_timestep()
+
+        if self.debugging:
+            self.occupancy_sanity_check()
 
         # Step 1: Update ball position and check where we landed
         #######################################################################
-        for ball in self.balls:
-            self._resolve_ball_physics(ball)
+        with self.profile('ball physics'):
+            for ball in self.balls:
+                self._resolve_ball_physics(ball)
 
         # Step 2: Resolve object collision + destruction
         #######################################################################
@@ -373,81 +653,360 @@ class BreakoutEngine(gym.Env):
         #  then there will be more than one hit object per timestep in general,
         #  and entanglement is inevitable.
         #
-        if len(self.balls) == 1:
-            error_msg = red("Multiple collisions detected!")
-            indirect_hit_already = False
+        with self.profile('collisions'):
+            if len(self.balls) == 1:
+                error_msg = red("Multiple collisions detected!")
+                indirect_hit_already = False
 
-            for hit in self.hit_objects:
-                if not hit.indirect_collision_effects:
-                    assert not indirect_hit_already, error_msg
-                    indirect_hit_already = True
+                for hit in self.hit_objects:
+                    if not hit.indirect_collision_effects:
+                        assert not indirect_hit_already, error_msg
+                        indirect_hit_already = True
 
-        for collided_object in self.hit_objects:
+            for collided_object in self.hit_objects:
 
-            # Call all the collision-triggered effects
-            self.debugprint_line('collision')
-            collided_object._collision_effect(self)
+                # Call all the collision-triggered effects
+                self.debugprint_line('collision')
+                collided_object._collision_effect(self)
 
-            # Call all the destruction-triggered effects
-            if collided_object.hitpoints == 0:
-                self.debugprint_line('destruction')
-                collided_object._destruction_effect(self)
+                # Call all the destruction-triggered effects
+                if collided_object.hitpoints == 0:
+                    self.debugprint_line('destruction')
+                    collided_object._destruction_effect(self)
 
         # Step 3: Update moving obstacles positions
         #######################################################################
-        for obstacle in self.miscellaneous:
-            if isinstance(obstacle, MomentumObject):
-                ox, oy = obstacle.position
-                vx, vy = obstacle.velocity
-
-                new_nzis_pos = set(offset_nzis_from_position(
-                    obstacle.nzis, (ox + vx, oy + vy)))
-                new_nzis_neg = set(offset_nzis_from_position(
-                    obstacle.nzis, (ox - vx, oy - vy)))
-
-                occupied_positions = self.occupied_by(exclude=([obstacle] +
-                                                               self.balls))
-
-                # Excluding ball and paddle!
-                if not (new_nzis_pos & set(occupied_positions)):
-                    obstacle.position = ox + vx, oy + vy
-                elif not (new_nzis_neg & set(occupied_positions)):
-                    obstacle.position = ox - vx, oy - vy
-                    obstacle.velocity = -vx, -vy
-                else:
-                    pass
+        with self.profile('moving obstacles'):
+            for obstacle in self.miscellaneous:
+                if isinstance(obstacle, MomentumObject):
+                    ox, oy = obstacle.position
+                    vx, vy = obstacle.velocity
+
+                    # The occupancy grid holds every tangible object but the
+                    # balls, which obstacles move through; it is updated in
+                    # place as the obstacle moves.
+                    if not self.occupancy.overlaps(obstacle,
+                                                   (ox + vx, oy + vy)):
+                        obstacle.position = ox + vx, oy + vy
+                    elif not self.occupancy.overlaps(obstacle,
+                                                     (ox - vx, oy - vy)):
+                        obstacle.position = ox - vx, oy - vy
+                        obstacle.velocity = -vx, -vy
+
+        # Steps 4 to 6: paddle, conditional events and cleanup
+        #######################################################################
+        self._end_timestep(action)
+
+    def _begin_timestep(self):
+        """
+        Reset the per-timestep variables, before the balls move.
+        """
+        self.invalidate_debug_info()
+        self.reward = 0
+
+        # Important: reset at every time step!
+        self.hit_objects = set()
+
+        # Invalid value to make sure it is set before step() returns!
+        self.done = None
+
+        self.debugprint_header()
 
+    def _end_timestep(self, action):
+        """
+        Last phases of a timestep, once the balls and obstacles have moved:
+        move the paddle, trigger the conditional events, manage the end of the
+        game and clip the reward. Shared by `_play_timestep` and
+        `_fast_forward`.
+
+        Parameters
+        ----------
+        action : int
+
+        Returns
+        -------
+        event_happened : bool
+            Whether any conditional event was triggered.
+        """
         # Step 4: Update paddle position
         #######################################################################
-        self.update_paddle_position(action)
+        with self.profile('paddle'):
+            self.update_paddle_position(action)
 
         # Step 5: resolve conditional events
         #######################################################################
-        for event in self.conditional_events:
-            if event.happens(self):
-                self.debugprint_line('conditional event', event)
-                event.trigger(self)
+        event_happened = False
+
+        with self.profile('conditional events'):
+            for event in self.conditional_events:
+                if event.happens(self):
+                    self.debugprint_line('conditional event', event)
+                    event.trigger(self)
+                    event_happened = True
 
         # Step 6: Cleanup and return
         #######################################################################
-        self.current_episode_frame += 1
-        self.end_game_manager()  # should set self.done!
-        assert self.done is not None
+        with self.profile('cleanup'):
+            self.current_episode_frame += 1
+            self.end_game_manager()  # should set self.done!
+            assert self.done is not None
+
+        # Constrain reward to be in {-1, 0, 1}
+        self.reward = np.clip(self.reward, -1, 1)
+        self.debugprint_line('reward')
+
+        return event_happened
+
+    def step_many(self, action, max_steps, return_frames=False):
+        """
+        Repeat an action for up to `max_steps` timesteps, or until the game is
+        done. This plays the same timesteps as `max_steps` calls to
+        `step(action)` with a `frameskip` of 1: the game goes through the same
+        states and random draws, and yields the same rewards. However,
+        timesteps during which every ball is bound to fly through empty space
+        (see `free_flight_horizon`) are fast-forwarded, and observations are
+        only computed if asked.
+
+        Parameters
+        ----------
+        action : int
+            The action to perform at every timestep.
+        max_steps : int
+            Maximum number of timesteps to play, regardless of `frameskip`.
+        return_frames : bool
+            If True, also return the observation of every timestep played.
+
+        Returns
+        -------
+        observation : np.array or dict
+            Observation after the last timestep played.
+        reward : float
+            Sum of the rewards received over the timesteps played.
+        done : bool
+            Indicates whether the environment has reached a termination state.
+        debug_info : dict
+            'num_steps' is the number of timesteps played, among which
+            'num_fast_forwarded_steps' were fast-forwarded. If `return_frames`
+            is True, 'frames' holds the observation of every timestep played.
+        """
+        if self.reset_has_never_been_called:
+            raise ResetHasNeverBeenCalledError
+
+        if not self.action_space.contains(action):
+            raise ValueError("Invalid action: {}".format(action))
+
+        frames = [] if return_frames else None
+        reward, done, num_steps, num_fast_forwarded_steps = \
+            self._play(action, max_steps, frames)
+
+        if frames:
+            observation = frames[-1]
+        else:
+            observation = self.get_observation()
 
         debug_info = {
-            'entity_states':  self.get_entity_states(),
+            'num_steps': num_steps,
+            'num_fast_forwarded_steps': num_fast_forwarded_steps,
         }
+        if frames is not None:
+            debug_info['frames'] = frames
+
+        return observation, reward, done, debug_info
+
+    def _play(self, action, max_steps, frames=None, fast_forward=True):
+        """
+        Repeat an action for up to `max_steps` timesteps, or until the game is
+        done, fast-forwarding timesteps during which the balls fly through
+        empty space (see `free_flight_horizon` and `_fast_forward`).
+
+        Parameters
+        ----------
+        action : int
+        max_steps : int
+        frames : list or None
+            If not None, the observation of every timestep is appended to it.
+        fast_forward : bool
+            If False, every timestep is played in full by `_play_timestep`.
+
+        Returns
+        -------
+        reward : float
+            Sum of the rewards received over the timesteps played.
+        done : bool
+        num_steps : int
+            Number of timesteps played.
+        num_fast_forwarded_steps : int
+            Number of those timesteps that were fast-forwarded.
+        """
+        total_reward = 0
+        num_steps = 0
+        num_fast_forwarded_steps = 0
+        done = False
+
+        while num_steps < max_steps and not done:
+            if fast_forward:
+                horizon = self.free_flight_horizon(max_steps - num_steps)
+            else:
+                horizon = 0
+
+            if horizon > 0:
+                rewards, done = self._fast_forward(action, horizon, frames)
+                total_reward += sum(rewards)
+                num_steps += len(rewards)
+                num_fast_forwarded_steps += len(rewards)
+            else:
+                self._play_timestep(action)
+                total_reward += self.reward
+                done = self.done
+                num_steps += 1
+
+                if frames is not None:
+                    frames.append(self.get_observation())
+
+        return total_reward, done, num_steps, num_fast_forwarded_steps
+
+    def free_flight_horizon(self, max_steps):
+        """
+        Number of upcoming timesteps (at most `max_steps`) during which every
+        ball is bound to move in a straight line through empty space, whatever
+        the paddle does: that is, until a ball is about to reach an object in
+        the occupancy grid, the rows the paddle may occupy, or the bottom of
+        the game. Ball physics then reduces to the `[Emptiness]` case of
+        `_resolve_ball_physics`, and nothing can be hit.
+
+        Moving obstacles change the occupancy grid at every timestep, so no
+        timestep is considered free when there are any.
+
+        Parameters
+        ----------
+        max_steps : int
+
+        Returns
+        -------
+        horizon : int
+        """
+        if (self.debugging or self.all_good_bricks_destroyed() or
+                any(isinstance(obj, MomentumObject)
+                    for obj in self.miscellaneous)):
+            return 0
+
+        # The paddle only moves horizontally
+        paddle_y = self.paddle.position[1]
+        paddle_y_min = paddle_y + self.paddle.nzis_min[1]
+        paddle_y_max = paddle_y + self.paddle.nzis_max[1]
+
+        is_occupied = self.occupancy.is_occupied
+        horizon = max_steps
+
+        for ball in self.balls:
+            x, y = ball.position
+            vx, vy = self.index_to_velocity[ball.velocity_index]
+
+            if paddle_y_min <= y <= paddle_y_max:
+                return 0
+
+            for t in xrange(horizon):
+                x += vx
+                y += vy
+
+                if (y <= 0 or paddle_y_min <= y <= paddle_y_max or
+                        is_occupied((x, y))):
+                    horizon = t
+                    break
+
+        return horizon
+
+    def _fast_forward(self, action, num_steps, frames=None):
+        """
+        Play timesteps during which every ball flies through empty space (see
+        `free_flight_horizon`). Everything else happens as in
+        `_play_timestep`, through `_end_timestep`. Stops early after a
+        timestep that triggers an event, yields a reward or ends the game,
+        since the balls may no longer be in free flight.
+
+        Parameters
+        ----------
+        action : int
+        num_steps : int
+            Number of timesteps, at most the free flight horizon.
+        frames : list or None
+            If not None, the observation of every timestep is appended to it.
+
+        Returns
+        -------
+        rewards : [float]
+            Reward of every timestep played.
+        done : bool
+        """
+        velocities = [self.index_to_velocity[ball.velocity_index]
+                      for ball in self.balls]
+        rewards = []
+
+        for _ in xrange(num_steps):
+            self._begin_timestep()
+
+            with self.profile('fast-forward'):
+                for ball, (vx, vy) in zip(self.balls, velocities):
+                    bx, by = ball.position
+                    ball.position = bx + vx, by + vy
+
+            event_happened = self._end_timestep(action)
+            rewards.append(self.reward)
+
+            if frames is not None:
+                frames.append(self.get_observation())
 
+            if event_happened or self.reward != 0 or self.done:
+                break
+
+        return rewards, self.done
+
+    def get_observation(self):
+        """
+        Observation of the current state of the game, as returned by `step`.
+
+        Returns
+        -------
+        np.array or dict
+            Image of the game if `return_state_as_image`, entity states
+            otherwise.
+        """
         if self.return_state_as_image:
-            state = self._get_image()
+            return self._get_image()
         else:
-            state = debug_info['entity_states']
+            return self.get_reported_entity_states()
 
-        # Constrain reward to be in {-1, 0, 1}
-        self.reward = np.clip(self.reward, -1, 1)
-        self.debugprint_line('reward')
+    def get_debug_info(self):
+        """
+        Debug information returned by `step`. See the
+        `entity_states_in_debug_info` parameter. Entity states are profiled
+        as the 'entity states' section when they are computed, i.e., only on
+        first access if they are lazy.
+
+        Returns
+        -------
+        debug_info : dict or LazyDebugInfo
+        """
+        if (not self.return_state_as_image or
+                self.entity_states_in_debug_info == 'always'):
+            with self.profile('entity states'):
+                return {'entity_states': self.get_reported_entity_states()}
+        elif self.entity_states_in_debug_info == 'lazy':
+            self._lazy_debug_info = LazyDebugInfo(
+                {'entity_states': lambda: self._profiled(
+                    'entity states', self.get_reported_entity_states)})
+            return self._lazy_debug_info
+        else:
+            return {}
 
-        return state, self.reward, self.done, debug_info
+    def invalidate_debug_info(self):
+        """
+        Prevent the lazy debug information last returned by `step` from
+        computing values once the game moves on.
+        """
+        if self._lazy_debug_info is not None:
+            self._lazy_debug_info.invalidate()
+            self._lazy_debug_info = None
 
     def layout(self):
         """
@@ -459,6 +1018,224 @@ class BreakoutEngine(gym.Env):
         """
         raise NotImplementedError
 
+    ###########################################################################
+    # State snapshots
+    ###########################################################################
+
+    def get_state(self):
+        """
+        Snapshot of the mutable state of the game, to be restored later with
+        `set_state`, e.g. to branch the simulator when planning. Only what may
+        change during a game is captured: static structures (walls, velocity
+        tables, etc.) are not copied, and game objects are referenced rather
+        than copied, along with the values of their mutable attributes.
+
+        Subclasses holding additional mutable state should extend both this
+        method and `set_state`.
+
+        Returns
+        -------
+        state : dict
+            Opaque snapshot of the game.
+        """
+        if self.reset_has_never_been_called:
+            raise ResetHasNeverBeenCalledError
+
+        def object_state(obj):
+            return (obj, obj.position, obj.nzis, obj.color,
+                    obj.visible, obj.hitpoints)
+
+        return {
+            'balls': [(object_state(ball), ball.velocity_index)
+                      for ball in self.balls],
+            'lost_balls': [(object_state(ball), ball.velocity_index)
+                           for ball in self.lost_balls],
+            'paddle': object_state(self.paddle),
+            'bricks': [object_state(brick) for brick in self.bricks],
+            'miscellaneous': [(object_state(obj),
+                               getattr(obj, 'velocity', None))
+                              for obj in self.miscellaneous],
+            'events': [event.__dict__.copy()
+                       for event in self.conditional_events],
+            'num_lives': self.num_lives,
+            'ball_movement_radius': self.ball_movement_radius,
+            'current_episode_frame': self.current_episode_frame,
+            'brick_hit_counter': self.brick_hit_counter,
+            'unique_entity_id': BreakoutObject.unique_entity_id,
+            'unique_object_id': BreakoutObject.unique_object_id,
+            'accelerator_trigger_counter': AcceleratorBrick.trigger_counter,
+            'paddle_shrinking_trigger_count':
+                PaddleShrinkingWall.trigger_count,
+            'np_random_state': self.np_random.get_state(),
+            'paddle_speed_sampler_state':
+                self.paddle_speed_sampler.get_state(),
+            'uniform_sampler_state': self.uniform_sampler.get_state(),
+        }
+
+    def set_state(self, state):
+        """
+        Restore a snapshot of the game taken with `get_state`. The same
+        snapshot may be restored any number of times.
+
+        Parameters
+        ----------
+        state : dict
+            Snapshot returned by `get_state`.
+        """
+        self.invalidate_debug_info()
+
+        # Protected attributes notify the occupancy grid and the renderers
+        # whenever they are set, so only those that changed are restored
+        def restore_object(obj, position, nzis, color, visible, hitpoints):
+            if obj.nzis is not nzis:
+                obj.nzis = nzis
+            if obj.position != position:
+                obj.position = position
+            obj.color = color
+            obj.visible = visible
+            obj.hitpoints = hitpoints
+            return obj
+
+        def restore_balls(ball_states):
+            balls = []
+            for object_state, velocity_index in ball_states:
+                ball = restore_object(*object_state)
+                ball.velocity_index = velocity_index
+                balls.append(ball)
+            return balls
+
+        self.balls = restore_balls(state['balls'])
+        self.lost_balls = restore_balls(state['lost_balls'])
+        self.paddle = restore_object(*state['paddle'])
+
+        # Reassigning the bricks rebuilds the brick store
+        bricks = [restore_object(*object_state)
+                  for object_state in state['bricks']]
+        if bricks != list(self.bricks):
+            self.bricks = bricks
+
+        miscellaneous = []
+        for object_state, velocity in state['miscellaneous']:
+            obj = restore_object(*object_state)
+            if velocity is not None:
+                obj.velocity = velocity
+            miscellaneous.append(obj)
+        self.miscellaneous = miscellaneous
+
+        # The snapshot may come from a previous game, whose objects are not
+        # tracked by the occupancy grid (e.g., the paddle is created anew at
+        # each reset)
+        if set(self.occupancy.objects) != set(self.tangible_objects):
+            self.occupancy.clear()
+            self.occupancy = self.build_occupancy_grid()
+
+        if set(self.state_hasher.objects) != set(self.hashed_objects):
+            self.state_hasher.clear()
+            self.state_hasher = self.build_state_hasher()
+
+        for event, attributes in zip(self.conditional_events,
+                                     state['events']):
+            event.__dict__.update(attributes)
+
+        self.num_lives = state['num_lives']
+        self.ball_movement_radius = state['ball_movement_radius']
+        self.current_episode_frame = state['current_episode_frame']
+        self.brick_hit_counter = state['brick_hit_counter']
+        BreakoutObject.unique_entity_id = state['unique_entity_id']
+        BreakoutObject.unique_object_id = state['unique_object_id']
+        AcceleratorBrick.trigger_counter = \
+            state['accelerator_trigger_counter']
+        PaddleShrinkingWall.trigger_count = \
+            state['paddle_shrinking_trigger_count']
+        self.np_random.set_state(state['np_random_state'])
+        self.paddle_speed_sampler.set_state(
+            state['paddle_speed_sampler_state'])
+        self.uniform_sampler.set_state(state['uniform_sampler_state'])
+
+    def simulate(self, state, action_sequences):
+        """
+        Simulate several sequences of actions from the same snapshot, e.g. to
+        evaluate candidate plans. Branches are played one after the other in
+        this environment, restoring the snapshot before each of them, so that
+        the static layout is shared and no observation is rendered. Each
+        action is played as by `step`, i.e. for `frameskip` timesteps, and
+        timesteps of free flight are fast-forwarded as by `step_many`.
+
+        Since every branch starts from the same random state, branches playing
+        the same actions go through the same random draws. The state of the
+        environment is restored once all the branches have been played.
+
+        Parameters
+        ----------
+        state : dict
+            Snapshot returned by `get_state`.
+        action_sequences : numpy.ndarray[:, :] (dtype=int)
+            Actions of each branch, shaped (num_branches, num_steps).
+
+        Returns
+        -------
+        rewards : numpy.ndarray[:, :] (dtype=float)
+            Reward of each step of each branch, shaped like
+            `action_sequences`. Steps past the end of a game yield no reward.
+        dones : numpy.ndarray[:, :] (dtype=bool)
+            Whether the game of each branch is over after each step.
+        """
+        action_sequences = np.asarray(action_sequences)
+
+        if action_sequences.ndim != 2:
+            raise ValueError("Action sequences must be shaped "
+                             "(num_branches, num_steps), got {}"
+                             .format(action_sequences.shape))
+
+        for action in np.unique(action_sequences):
+            if not self.action_space.contains(action):
+                raise ValueError("Invalid action: {}".format(action))
+
+        rewards = np.zeros(action_sequences.shape)
+        dones = np.zeros(action_sequences.shape, dtype=bool)
+        current_state = self.get_state()
+
+        try:
+            for k, actions in enumerate(action_sequences.tolist()):
+                self.set_state(state)
+
+                for t, action in enumerate(actions):
+                    rewards[k, t], done, _, _ = self._play(action,
+                                                           self.frameskip)
+                    if done:
+                        dones[k, t:] = True
+                        break
+        finally:
+            self.set_state(current_state)
+
+        return rewards, dones
+
+    def state_hash(self):
+        """
+        64-bit hash of the state of the game, e.g. to detect transpositions in
+        a tree search: the positions and velocities of the balls (lost or
+        not), the position and shape of the paddle, the remaining bricks and
+        their hitpoints, the positions and velocities of the obstacles, the
+        ball movement radius and the number of lives.
+
+        The hash is maintained incrementally as objects change, so its cost
+        only depends on the number of objects that changed since the last
+        call. It does not depend on the identity of the objects, so identical
+        states have the same hash across games and processes. The random
+        state, the frame counter and the state of the conditional events are
+        not hashed.
+
+        Returns
+        -------
+        int
+            Hash in [0, 2 ** 64).
+        """
+        if self.reset_has_never_been_called:
+            raise ResetHasNeverBeenCalledError
+
+        return combine_keys(self.state_hasher.value, self.num_lives,
+                            self.ball_movement_radius)
+
     ###########################################################################
     # Core methods and properties
     ###########################################################################
@@ -468,7 +1245,7 @@ class BreakoutEngine(gym.Env):
         Check that no two objects overlap
         """
         error_msg = "Several objects are overlapping!"
-        considered_objects = self.bricks + self.miscellaneous
+        considered_objects = list(self.bricks) + self.miscellaneous
         all_occupied_nzis = [nzi for obj in considered_objects
                              for nzi in obj.offset_nzis if obj.visible]
 
@@ -485,9 +1262,20 @@ class BreakoutEngine(gym.Env):
 
         # Assuming all the moving objects are paddle, ball, or in miscellaneous
         error_msg = "Moveable objects have to be in miscellaneous only!"
-        for obj in self.bricks + self.walls:
+        for obj in list(self.bricks) + self.walls:
             assert not isinstance(obj, MoveableObject)
 
+    def occupancy_sanity_check(self):
+        """
+        Check that the incrementally updated occupancy grid matches the
+        pixels actually covered by tangible objects.
+        """
+        error_msg = "Occupancy grid is out of sync with game objects!"
+        occupied_positions = self.occupied_by(objects=self.tangible_objects)
+        grid_positions = set(zip(*self.occupancy.counts.nonzero()))
+
+        assert occupied_positions == grid_positions, error_msg
+
     @property
     def ball_movement_radius(self):
         return self._ball_movement_radius
@@ -498,20 +1286,20 @@ class BreakoutEngine(gym.Env):
         self._ball_movement_radius = value
 
     @property
-    def index_to_velocity(self):
+    def velocity_tables(self):
         """
-        Velocities with adjacent index are considered sort of similar, so we
-        can stochastically add or remove 1 to its index in ball velocity-
-        randomizing functions such as `randomize_velocity`, so that the ball
-        slowly drifts to other directions.
+        Lookup tables of the ball velocities allowed at the current ball
+        movement radius. They are computed once per radius and set of excluded
+        velocities, and looked up several times per bounce.
 
         Returns
         -------
-        (int, int)
-            Velocity in the (dx, dy) format.
+        VelocityTables
         """
+        key = (self.ball_movement_radius, self.excluded_velocities)
+
         try:
-            return self._memoized_index_to_velocity[self.ball_movement_radius]
+            return self._memoized_velocity_tables[key]
         except KeyError:
             unit_square = []
             coordinates = xrange(-self.ball_movement_radius,
@@ -525,28 +1313,171 @@ class BreakoutEngine(gym.Env):
                 else:
                     unit_square += [(dx, dy)]
 
-            self._memoized_index_to_velocity[self.ball_movement_radius] = \
-                dict(enumerate(unit_square))
-        finally:
-            return self._memoized_index_to_velocity[self.ball_movement_radius]
+            index_to_velocity = dict(enumerate(unit_square))
+            velocity_to_index = {v: k
+                                 for k, v in index_to_velocity.iteritems()}
+            indices = index_to_velocity.keys()
+            same_quadrant_indices = {
+                k: [l for l in indices
+                    if (np.sign(index_to_velocity[k]) ==
+                        np.sign(index_to_velocity[l])).all()]
+                for k in indices
+            }
+
+            tables = VelocityTables(index_to_velocity, velocity_to_index,
+                                    indices, same_quadrant_indices)
+            self._memoized_velocity_tables[key] = tables
+
+            return tables
+
+    @property
+    def index_to_velocity(self):
+        """
+        Velocities with adjacent index are considered sort of similar, so we
+        can stochastically add or remove 1 to its index in ball velocity-
+        randomizing functions such as `randomize_velocity`, so that the ball
+        slowly drifts to other directions.
+
+        Returns
+        -------
+        (int, int)
+            Velocity in the (dx, dy) format.
+        """
+        return self.velocity_tables.index_to_velocity
 
     @property
     def velocity_to_index(self):
         """
-        Generate the mapping that converts a velocity vector back to an index
-        representing that velocity.
+        Mapping that converts a velocity vector back to an index representing
+        that velocity.
 
         Returns
         -------
         velocity_to_index : {(int, int): int}
             Mapping from velocity in the (dx, dy) format to a single index.
         """
-        velocity_to_index = {}
+        return self.velocity_tables.velocity_to_index
+
+    @property
+    def bricks(self):
+        """
+        Bricks present in the game, in order of addition. Reassigning them
+        (e.g., when a layout respawns them) keeps the occupancy grid in sync.
+        Use `add_brick` and `remove_brick` to add or remove a single brick:
+        the bricks are returned as a tuple, so that they cannot be mutated in
+        place behind the back of the brick store.
+
+        Returns
+        -------
+        (Brick,)
+        """
+        return self._brick_store.bricks
+
+    @bricks.setter
+    def bricks(self, bricks):
+        old_bricks = self._brick_store.bricks
+        self._brick_store.clear()
+        self._brick_store = BrickStore(bricks)
+
+        if self.occupancy is not None:
+            self.occupancy.replace(old_bricks, bricks)
+
+        if self.state_hasher is not None:
+            self.state_hasher.replace(old_bricks, bricks)
+
+    def add_brick(self, brick):
+        """
+        Add a brick to the game, after the existing ones.
+
+        Parameters
+        ----------
+        brick : Brick
+        """
+        self._brick_store.add(brick)
+
+        if self.occupancy is not None:
+            self.occupancy.add(brick)
+
+        if self.state_hasher is not None:
+            self.state_hasher.add(brick)
+
+    def remove_brick(self, brick):
+        """
+        Remove a brick from the game in constant time, typically upon
+        destruction.
+
+        Parameters
+        ----------
+        brick : Brick
+        """
+        self._brick_store.remove(brick)
 
-        for k, v in self.index_to_velocity.iteritems():
-            velocity_to_index[v] = k
+        if self.occupancy is not None:
+            self.occupancy.discard(brick)
 
-        return velocity_to_index
+        if self.state_hasher is not None:
+            self.state_hasher.discard(brick)
+
+    @property
+    def tangible_objects(self):
+        """
+        Objects the balls may bounce against: everything but the balls and the
+        virtual walls of punishment.
+
+        Returns
+        -------
+        [BreakoutObject]
+        """
+        return ([wall for wall in self.walls
+                 if not isinstance(wall, WallOfPunishment)] +
+                list(self.bricks) + self.miscellaneous + [self.paddle])
+
+    def build_occupancy_grid(self):
+        """
+        Build the occupancy grid of tangible objects. The grid is then updated
+        in place as objects move, change shape or visibility, or as bricks are
+        removed, so that physics can rely on O(1) lookups.
+
+        Returns
+        -------
+        OccupancyGrid
+        """
+        grid = OccupancyGrid(self.width, self.height)
+
+        for obj in self.tangible_objects:
+            grid.add(obj)
+
+        return grid
+
+    @property
+    def hashed_objects(self):
+        """
+        Objects whose state contributes to `state_hash`: everything but the
+        walls, whose state never changes.
+
+        Returns
+        -------
+        [BreakoutObject]
+        """
+        return (list(self.bricks) + self.miscellaneous + self.balls +
+                self.lost_balls + [self.paddle])
+
+    def build_state_hasher(self):
+        """
+        Build the incremental hash of the objects of the game (see
+        `state_hash`). The hash is then updated as objects change, or as
+        bricks are removed.
+
+        Returns
+        -------
+        StateHash
+        """
+        hasher = StateHash()
+
+        for obj in self.hashed_objects:
+            hasher.add(obj)
+
+        return hasher
 
     @property
     def objects(self):
@@ -558,7 +1489,7 @@ class BreakoutEngine(gym.Env):
         [BreakoutObject]
             All the objects present in the game.
         """
-        return (self.walls + self.bricks + self.miscellaneous +
+        return (self.walls + list(self.bricks) + self.miscellaneous +
                 self.balls + [self.paddle])
 
     def occupied_by(self, objects=None, exclude=None):
@@ -639,27 +1570,56 @@ class BreakoutEngine(gym.Env):
             RGB image in the (r, c, 3) unsigned 8-byte integer format, with
             color values in (0, 255).
         """
-        image = self.get_background_image()
+        if self.rendering_mode == 'dirty_rectangles':
+            image = self.framebuffer.render(self.painting_order)
+        elif self.rendering_mode == 'static_layer':
+            image = self.framebuffer.render(*self.painting_layers)
+        else:
+            image = self.get_background_image()
 
-        for obj in self.walls + self.bricks + self.miscellaneous:
-            if not isinstance(obj, MomentumObject):
+            for obj in self.painting_order:
                 self.render_object(image, obj)
 
-        for obj in self.miscellaneous:
-            if isinstance(obj, MomentumObject):
-                self.render_object(image, obj)
+        image = np.ascontiguousarray(image[:, ::-1, :].transpose(1, 0, 2))
 
-        # Render the paddle
-        if self.paddle.visible:
-            self.render_object(image, self.paddle)
+        return image
 
-        # Render the balls (always last in order to always be visible)
-        for ball in self.balls:
-            self.render_object(image, ball)
+    @property
+    def painting_order(self):
+        """
+        Objects of the game in the order in which they are painted: static
+        objects, moving obstacles, paddle and balls (always last in order to
+        always be visible).
 
-        image = image[:, ::-1, :].transpose(1, 0, 2)
+        Returns
+        -------
+        [BreakoutObject]
+        """
+        static_objects, moving_objects = self.painting_layers
+        return static_objects + moving_objects
 
-        return image
+    @property
+    def painting_layers(self):
+        """
+        Objects of the game in painting order, split between static objects
+        (walls, bricks, fixed obstacles) and moving objects (moving obstacles,
+        paddle and balls).
+
+        Returns
+        -------
+        static_objects : [BreakoutObject]
+        moving_objects : [BreakoutObject]
+        """
+        static_objects = []
+        moving_obstacles = []
+
+        for obj in self.walls + list(self.bricks) + self.miscellaneous:
+            if isinstance(obj, MomentumObject):
+                moving_obstacles.append(obj)
+            else:
+                static_objects.append(obj)
+
+        return static_objects, moving_obstacles + [self.paddle] + self.balls
 
     def get_background_image(self):
         """
@@ -722,6 +1682,23 @@ class BreakoutEngine(gym.Env):
         """
         parsed_pixels = []
 
+        # Walls made of several one-pixel entities, e.g. environment borders
+        if isinstance(breakout_object, Wall) and \
+           breakout_object.pixel_entities is not None:
+            x, y = breakout_object.position
+            color = breakout_object.color
+
+            for (du, dv), eid in breakout_object.pixel_entities.iteritems():
+                r, c = self.xy2rc((x + du, y + dv))
+                state = {
+                    ('position', (r, c)):   0.0,
+                    ('shape', (0, 0)):      0.0,
+                    ('color', color):       0.0,
+                }
+                parsed_pixels.append((state, eid))
+
+            return parsed_pixels
+
         # Filter valid NZIs
         if self.report_nzis_as_entities == 'all':
             reported_nzis = breakout_object.offset_nzis
@@ -759,6 +1736,35 @@ class BreakoutEngine(gym.Env):
 
         return parsed_pixels
 
+    def get_object_entity_states(self, breakout_object):
+        """
+        Memoized version of `parse_object_into_pixels`. Parsed entity states
+        are cached on the object until its position, nzis, color or visibility
+        change (see `BreakoutObject.reset_cache`), so that only the objects
+        that changed since the previous timestep are parsed again.
+
+        Parameters
+        ----------
+        breakout_object : BreakoutObject
+
+        Returns
+        -------
+        entity_states : {int: {
+                ('position', (int, int)): 0.0,
+                ('shape', (int, int)): 0.0,
+                ('color', (int, int, int)): 0.0,
+            }}
+
+            Entity states of the object, indexed by entity ID. They are shared
+            across timesteps, and should not be mutated.
+        """
+        if breakout_object._cached_entity_states is None:
+            breakout_object._cached_entity_states = {
+                eid: state for state, eid in
+                self.parse_object_into_pixels(breakout_object)}
+
+        return breakout_object._cached_entity_states
+
     def get_entity_states(self):
         """
         Entity states that we may resonably expect a computer vision system to
@@ -780,36 +1786,110 @@ class BreakoutEngine(gym.Env):
         """
         entity_states = {}
 
-        # Ball ################################################################
-        for ball in self.balls:
-            if ball.is_entity:
-                for state, eid in self.parse_object_into_pixels(ball):
-                    entity_states[eid] = state
-
-        # Paddle ##############################################################
-        if self.paddle.is_entity:
-            for state, eid in self.parse_object_into_pixels(self.paddle):
-                entity_states[eid] = state
-
-        # Miscellaneous objects ###############################################
-        for obj in self.miscellaneous:
-            if obj.is_entity:
-                for state, eid in self.parse_object_into_pixels(obj):
-                    entity_states[eid] = state
-
-        # Walls and bricks ####################################################
-        for wall in self.walls:
-            if wall.is_entity:
-                for state, eid in self.parse_object_into_pixels(wall):
-                    entity_states[eid] = state
-
-        for brick in self.bricks:
-            if brick.is_entity:
-                for state, eid in self.parse_object_into_pixels(brick):
-                    entity_states[eid] = state
+        for obj in self.entity_objects:
+            entity_states.update(self.get_object_entity_states(obj))
 
         return entity_states
 
+    def get_object_entity_array(self, breakout_object):
+        """
+        Memoized, array-backed version of `get_object_entity_states`.
+
+        Parameters
+        ----------
+        breakout_object : BreakoutObject
+
+        Returns
+        -------
+        entity_array : numpy.ndarray (dtype=ENTITY_STATE_DTYPE)
+            Entity states of the object, one record per entity. Shared across
+            timesteps, and should not be mutated.
+        """
+        if breakout_object._cached_entity_array is None:
+            entity_states = self.get_object_entity_states(breakout_object)
+            entity_array = np.empty(len(entity_states),
+                                    dtype=ENTITY_STATE_DTYPE)
+
+            for i, (eid, state) in enumerate(entity_states.iteritems()):
+                attributes = dict(state.keys())
+                r, c = attributes['position']
+                du, dv = attributes['shape']
+                color = self.get_color_index(attributes['color'])
+                entity_array[i] = (eid, r, c, du, dv, color)
+
+            breakout_object._cached_entity_array = entity_array
+
+        return breakout_object._cached_entity_array
+
+    def get_entity_array(self):
+        """
+        Compact alternative to `get_entity_states`: same entities, reported as
+        a NumPy structured array rather than a dictionary of dictionaries,
+        which is much cheaper to build and to store.
+
+        Returns
+        -------
+        entity_array : numpy.ndarray (dtype=ENTITY_STATE_DTYPE)
+            One record per entity, with fields 'eid', 'row', 'col' (position),
+            'du', 'dv' (shape) and 'color' (index of the color in
+            `self.standard_color_map`).
+        """
+        entity_arrays = [self.get_object_entity_array(obj)
+                         for obj in self.entity_objects]
+
+        if not entity_arrays:
+            return np.empty(0, dtype=ENTITY_STATE_DTYPE)
+
+        return np.concatenate(entity_arrays)
+
+    def get_reported_entity_states(self):
+        """
+        Entity states in the format set by `self.entity_state_format`.
+
+        Returns
+        -------
+        entity_states : dict or numpy.ndarray (dtype=ENTITY_STATE_DTYPE)
+            See `get_entity_states` and `get_entity_array`.
+        """
+        if self.entity_state_format == 'array':
+            return self.get_entity_array()
+        else:
+            return self.get_entity_states()
+
+    def get_color_index(self, color):
+        """
+        Index of a color in `self.standard_color_map`. Colors that appear
+        during the game (e.g., a StrongBrick dimming when hit) are appended to
+        the map.
+
+        Parameters
+        ----------
+        color : (int, int, int)
+
+        Returns
+        -------
+        int
+        """
+        if color not in self.standard_color_map:
+            self.standard_color_map[color] = len(self.standard_color_map)
+
+        return self.standard_color_map[color]
+
+    @property
+    def entity_objects(self):
+        """
+        Objects reported as entities, in reporting order: balls, paddle,
+        miscellaneous objects, walls and bricks.
+
+        Returns
+        -------
+        [BreakoutObject]
+        """
+        return [obj for obj in (self.balls + [self.paddle] +
+                                self.miscellaneous + self.walls +
+                                list(self.bricks))
+                if obj.is_entity]
+
     ###########################################################################
     # Game dynamics
     ###########################################################################
@@ -848,6 +1928,10 @@ class BreakoutEngine(gym.Env):
         """
         assert isinstance(ball, Ball)
 
+        profiler = self.profiler
+        if profiler is not None:
+            start = profiler.clock()
+
         bx, by = ball.position
         vx, vy = self.index_to_velocity[ball.velocity_index]
         orig_vx, orig_vy = vx, vy
@@ -858,6 +1942,9 @@ class BreakoutEngine(gym.Env):
         if self.paddle.contains_position((bx, by)):
             self.debugprint_line('ball inside paddle')
             ball.position = vx + bx, vy + by
+
+            if profiler is not None:
+                profiler.record('ball physics: inside paddle', start)
             return
 
         # Step A: Update ball position.
@@ -865,17 +1952,17 @@ class BreakoutEngine(gym.Env):
         vx_after_paddle_bounce = \
             self.get_ball_vx_after_paddle_bounce(bx, by, vx, vy)
 
-        intangible = [obj for obj in self.walls
-                      if isinstance(obj, WallOfPunishment)] + self.balls
-        occupied_positions = self.occupied_by(exclude=intangible)
+        # Tangible objects only, i.e. excluding balls and walls of punishment
+        is_occupied = self.occupancy.is_occupied
 
         self.hit_objects |= self.get_collision_elements((bx + vx, by + vy))
 
         # [Emptiness]
-        if (bx + vx, by + vy) not in occupied_positions and \
+        if not is_occupied((bx + vx, by + vy)) and \
            vx_after_paddle_bounce is None:
 
             self.debugprint_line('ball physics', 0, vx_after_paddle_bounce)
+            branch = 'emptiness'
 
             # Easiest case! Destination is empty. Notice that this assumes
             # there are no walls that are 1 pixel thick. If that was the case,
@@ -886,6 +1973,7 @@ class BreakoutEngine(gym.Env):
         # [Bounce, paddle]
         elif vx_after_paddle_bounce is not None:
             self.debugprint_line('ball physics', 1, vx_after_paddle_bounce)
+            branch = 'paddle bounce'
 
             vx = vx_after_paddle_bounce
             vy *= -1
@@ -897,14 +1985,15 @@ class BreakoutEngine(gym.Env):
             ball.velocity_index = self.velocity_to_index[(vx, vy)]
             ball.position = vx + bx, vy + by
 
-            if (vx + bx, vy + by) in occupied_positions:
+            if is_occupied((vx + bx, vy + by)):
                 vx *= -1
                 ball.velocity_index = self.velocity_to_index[(vx, vy)]
                 ball.position = vx + bx, vy + by
 
         # [Bounce, brick or wall]
-        elif (bx + vx, by) in occupied_positions:
+        elif is_occupied((bx + vx, by)):
             self.debugprint_line('ball physics', 2, vx_after_paddle_bounce)
+            branch = 'brick or wall bounce'
 
             vx *= -1
             ball.velocity_index = self.velocity_to_index[(vx, vy)]
@@ -913,8 +2002,9 @@ class BreakoutEngine(gym.Env):
             ball.position = vx + bx, vy + by
 
         # [Bounce, brick or wall]
-        elif (bx, by + vy) in occupied_positions:
+        elif is_occupied((bx, by + vy)):
             self.debugprint_line('ball physics', 3, vx_after_paddle_bounce)
+            branch = 'brick or wall bounce'
 
             vy *= -1
             ball.velocity_index = self.velocity_to_index[(vx, vy)]
@@ -924,15 +2014,20 @@ class BreakoutEngine(gym.Env):
 
         else:
             self.debugprint_line('ball physics', 4, vx_after_paddle_bounce)
+            branch = 'reverse'
 
             vx, vy = -vx, -vy
             ball.velocity_index = self.velocity_to_index[(vx, vy)]
             ball.position = bx + vx, by + vy
 
+        if profiler is not None:
+            profiler.record('ball physics: ' + branch, start)
+            start = profiler.clock()
+
         # Step B: Check where we landed, manage any higher-order collisions
         #######################################################################
         vx, vy = self.index_to_velocity[ball.velocity_index]
-        if tuple(ball.position) in occupied_positions:
+        if is_occupied(ball.position):
             self.debugprint_line('higher-order collision')
 
             # -----------------------------------------------------------------
@@ -949,6 +2044,9 @@ class BreakoutEngine(gym.Env):
             ball.position = bx + vx, by + vy
             ball.velocity_index = self.velocity_to_index[(vx, vy)]
 
+            if profiler is not None:
+                profiler.record('ball physics: higher-order collision', start)
+
     def end_game_manager(self):
         """
         Helper function which determines whether the game is done.
@@ -1014,25 +2112,23 @@ class BreakoutEngine(gym.Env):
 
         Mutates
         -------
-        self.paddle.position : numpy.ndarray([int, int])
+        self.paddle.position : (int, int)
             Position of the paddle.
         """
-        speeds = np.arange(-self.paddle_speed, self.paddle_speed + 1)
-        dx = np.random.choice(speeds, p=self.paddle_speed_distribution)
-        dx, dy = {
-            self.LEFT:  np.array([-dx, 0]),
-            self.RIGHT: np.array([+dx, 0]),
-            self.NOOP:  np.array([0,   0]),
+        dx = self.paddle_speed_sampler.next(self.np_random)
+        dx = {
+            self.LEFT:  -dx,
+            self.RIGHT: +dx,
+            self.NOOP:  0,
         }[action]
 
         # If there is not enough space for a full translation,
         # move the paddle anyway until it bumps against a wall.
-        px = np.clip(self.paddle.position[0] + dx,
-                     self.accessible_domain[0],
-                     self.accessible_domain[1])
-        py = self.paddle.position[1] + dy
+        x_min, x_max = self.accessible_domain
+        px, py = self.paddle.position
+        px = min(max(px + dx, x_min), x_max)
 
-        self.paddle.position = np.array([px, py])
+        self.paddle.position = (px, py)
 
     def get_collision_elements(self, ball_position, is_indirect=False):
         """
@@ -1054,20 +2150,13 @@ class BreakoutEngine(gym.Env):
         """
         set_hit_objects = set()
 
-        for brick in self.bricks:
-            if brick.visible and brick.contains_position(ball_position):
-                if not is_indirect or brick.indirect_collision_effects:
-                    set_hit_objects |= {brick}
-
-        for wall in self.walls:
-            if wall.visible and wall.contains_position(ball_position):
-                if not is_indirect or wall.indirect_collision_effects:
-                    set_hit_objects |= {wall}
-
-        for misc in self.miscellaneous:
-            if misc.visible and misc.contains_position(ball_position):
-                if not is_indirect or misc.indirect_collision_effects:
-                    set_hit_objects |= {misc}
+        # Bricks, walls and miscellaneous objects are all indexed by the
+        # occupancy grid: only the paddle needs to be filtered out.
+        for obj in self.occupancy.objects_at(ball_position):
+            if obj is self.paddle:
+                continue
+            if not is_indirect or obj.indirect_collision_effects:
+                set_hit_objects.add(obj)
 
         return set_hit_objects
 
@@ -1086,23 +2175,21 @@ class BreakoutEngine(gym.Env):
         new_index : int
             Updated velocity index. See also `index_to_velocity`.
         """
-        if not bool(np.random.binomial(1, self.bounce_stochasticity)):
+        # Bernoulli and uniform integer draws from uniform variates
+        if self.uniform_sampler.next(self.np_random) >= \
+                self.bounce_stochasticity:
             return old_index
         else:
-            while True:
-                new_index = random.choice(self.index_to_velocity.keys())
-
-                # If True, make sure that new velocity stays in same quadrant
-                if not self.allow_bounce_against_physics:
-                    old_velocity = self.index_to_velocity[old_index]
-                    new_velocity = self.index_to_velocity[new_index]
+            tables = self.velocity_tables
 
-                    if (np.sign(old_velocity) == np.sign(new_velocity)).all():
-                        break
-                else:
-                    break
+            # If True, make sure that new velocity stays in same quadrant
+            if not self.allow_bounce_against_physics:
+                indices = tables.same_quadrant_indices[old_index]
+            else:
+                indices = tables.indices
 
-            return new_index
+            u = self.uniform_sampler.next(self.np_random)
+            return indices[int(u * len(indices))]
 
     def get_paddle_response_function(self):
         """
@@ -1114,7 +2201,24 @@ class BreakoutEngine(gym.Env):
         -------
         prf : numpy.ndarray([int])
             Horizontal components of the ball velocity, indexed by coordinate
-            along paddle length.
+            along paddle length. Memoized per ball movement radius and paddle
+            length, hence read-only.
+        """
+        key = (self.ball_movement_radius, self.paddle.shape[0])
+
+        try:
+            return self._memoized_paddle_response_functions[key]
+        except KeyError:
+            prf = self._compute_paddle_response_function()
+            prf.flags.writeable = False
+            self._memoized_paddle_response_functions[key] = prf
+
+            return prf
+
+    def _compute_paddle_response_function(self):
+        """
+        Compute the paddle response function, see
+        `get_paddle_response_function`.
         """
         size = self.paddle.shape[0]
         prf_center = [0] * (1 + (size + 1) % 2)
@@ -1187,13 +2291,13 @@ class BreakoutEngine(gym.Env):
             return None
 
         # The ball will not collide with the paddle
-        if (x + u, y + v) not in self.paddle.offset_nzis:
+        if not self.paddle.contains_position((x + u, y + v)):
             return None
 
         # Get paddle characteristics and determine where the ball will bounce
         prf = self.get_paddle_response_function()
-        paddle_x_min = min(px for px, py in self.paddle.offset_nzis)
-        paddle_x_max = max(px for px, py in self.paddle.offset_nzis)
+        paddle_x_min = self.paddle.position[0] + self.paddle.nzis_min[0]
+        paddle_x_max = self.paddle.position[0] + self.paddle.nzis_max[0]
 
         if paddle_x_min <= x <= paddle_x_max:   # Case #1 (see docstring)
             ball_impact_x = x
@@ -1228,8 +2332,8 @@ class BreakoutEngine(gym.Env):
                 raise ValueError("Bad x-position for the paddle.")
             px = self.paddle_starting_position[0]
         else:
-            px = random.randrange(self.accessible_domain[0],
-                                  self.accessible_domain[1] + 1)
+            px = self.np_random.randint(self.accessible_domain[0],
+                                        self.accessible_domain[1] + 1)
 
         if self.paddle_starting_position[1] is not None:
             py = self.paddle_starting_position[1]
@@ -1255,8 +2359,11 @@ class BreakoutEngine(gym.Env):
                                for k, v in self.index_to_velocity.iteritems()
                                if v[1] < 0}
 
+        downward_indices = downward_velocities.keys()
+
         for ball in self.balls:
-            ball.velocity_index = random.choice(downward_velocities.keys())
+            ball.velocity_index = downward_indices[
+                self.np_random.randint(len(downward_indices))]
 
         brick_ordinates = [self.height-1-self.wall_thickness]
         brick_ordinates += [brick.position[1] + brick.nzis_min[1]
@@ -1271,13 +2378,13 @@ class BreakoutEngine(gym.Env):
                 ###############################################################
                 ball_offsets = range(-self.num_balls-1, self.num_balls+2)
                 ball.position = (
-                    self.width // 2 + np.random.choice(ball_offsets),
-                    maximum_ball_y // 2 - random.randrange(_MAX_SPEED)
+                    self.width // 2 + self.np_random.choice(ball_offsets),
+                    maximum_ball_y // 2 - self.np_random.randint(_MAX_SPEED)
                 )
                 ###############################################################
                 occupied_positions = self.occupied_by(exclude={ball})
 
-                if tuple(ball.position) not in occupied_positions:
+                if ball.position not in occupied_positions:
                     if self.debugging:
                         print \
                             purple("Ball-paddle separation at collision:"), \
@@ -1285,6 +2392,77 @@ class BreakoutEngine(gym.Env):
                             purple("vertically when |v[y]| = %i" % _MAX_SPEED)
                     break
 
+    ###########################################################################
+    # Profiling methods
+    ###########################################################################
+
+    def enable_profiling(self, enabled=True):
+        """
+        Turn the accumulation of per-phase timings on or off. Statistics
+        accumulated so far are kept when profiling is turned off, and
+        accumulation resumes when it is turned back on; use
+        `reset_profiling_stats` to discard them.
+
+        Parameters
+        ----------
+        enabled : bool
+        """
+        # Hot paths only check whether `profiler` is None
+        self.profiler = self.profiling_stats if enabled else None
+
+    def profile(self, name):
+        """
+        Context manager timing a section of code, if profiling is enabled.
+        Does nothing otherwise, at the cost of a function call.
+
+        Parameters
+        ----------
+        name : str
+            Name of the section.
+        """
+        if self.profiler is None:
+            return NULL_SECTION
+        return self.profiler.section(name)
+
+    def _profiled(self, name, function):
+        """
+        Call a function, timing it as a section if profiling is enabled.
+
+        Parameters
+        ----------
+        name : str
+            Name of the section.
+        function : callable
+            Function called without arguments.
+
+        Returns
+        -------
+        object
+            Return value of `function`.
+        """
+        with self.profile(name):
+            return function()
+
+    def get_profiling_stats(self):
+        """
+        Wall time and number of calls of each phase of `_step`, of each branch
+        of `_resolve_ball_physics` (under 'ball physics: <branch>'), and of
+        the computation of the entity states and image.
+
+        Returns
+        -------
+        {str: {'total_time': float, 'calls': int, 'mean_time': float}}
+            Statistics of each section, times in seconds. Empty if profiling
+            has never been enabled.
+        """
+        return self.profiling_stats.summary()
+
+    def reset_profiling_stats(self):
+        """
+        Discard the profiling statistics accumulated so far.
+        """
+        self.profiling_stats.reset()
+
     ###########################################################################
     # Helper methods
     ###########################################################################
@@ -1337,10 +2515,7 @@ class BreakoutEngine(gym.Env):
         Helper function which returns True if all bricks yielding strictly
         positive reward have been destroyed, otherwise False.
         """
-        for brick in self.bricks:
-            if brick.reward > 0:
-                return False
-        return True
+        return self._brick_store.num_good_bricks == 0
 
     def xy2rc(self, position):
         """
@@ -2,7 +2,6 @@
 Conditional events. At every step, the game engine checks which of all
 registered events happen and triggers the requisite consequences if applicable.
 """
-import random
 from abc import abstractmethod, ABCMeta
 
 from schema_games.breakout.constants import _MAX_SPEED
@@ -100,9 +99,10 @@ class PaddleShrinksEvent(ConditionalEvent):
         self.cycle_length = cycle_length
         self.min_paddle_length = min_paddle_length
 
-        # Counter variables
+        # Counter variables. The frame of the first cycle is drawn from the
+        # random number generator of the environment, on the first check.
         self.cycle_counter = 0
-        self.index_in_cycle = random.randrange(self.cycle_length)
+        self.index_in_cycle = None
 
     def happens(self, environment):
         """
@@ -111,8 +111,9 @@ class PaddleShrinksEvent(ConditionalEvent):
         """
         new_cycle = (environment.current_episode_frame //
                      self.cycle_length > self.cycle_counter)
-        if new_cycle:
-            self.index_in_cycle = random.randrange(self.cycle_length)
+        if new_cycle or self.index_in_cycle is None:
+            self.index_in_cycle = environment.np_random.randint(
+                self.cycle_length)
             self.cycle_counter = (environment.current_episode_frame //
                                   self.cycle_length)
 
@@ -0,0 +1,331 @@
+"""
+Cached rendering strategies. Rather than repainting the background and every
+object of the game at each timestep, the engine may either:
+
+    - keep the image of the previous frame and only repaint the rectangles
+      that objects entered or vacated since then (dirty rectangles), along
+      with the objects overlapping them, so that the cost of rendering a frame
+      is proportional to the number of pixels that changed, not to the size
+      of the board (see Framebuffer);
+    - keep a pre-rendered image of the static objects, which is only rebuilt
+      when one of them changes, and composite the moving objects on top of
+      it at each frame (see StaticLayer).
+"""
+
+import numpy as np
+
+# Side of the square cells of the spatial index of the framebuffer, in pixels
+CELL_SIZE = 8
+
+
+class Framebuffer(object):
+    """
+    Persistent image of a set of BreakoutObject instances, indexed in the
+    game's native (x, y) coordinates.
+
+    The framebuffer registers itself as an observer of each object it draws,
+    so as to be notified of the objects whose position, shape, visibility or
+    color changed. Objects appearing in or disappearing from the game are
+    detected when rendering.
+
+    Drawn objects are indexed by the cells of a coarse grid that their
+    bounding boxes overlap, so that repainting a rectangle only visits the
+    objects overlapping it, rather than every object of the game.
+
+    Parameters
+    ----------
+    background : numpy.ndarray[:, :, :] (dtype=numpy.uint8)
+        Background image, shaped (width, height, 3).
+
+    Attributes
+    ----------
+    image : numpy.ndarray[:, :, :] (dtype=numpy.uint8)
+        Image of the last rendered frame, shaped (width, height, 3).
+    """
+    def __init__(self, background):
+        self.background = background.copy()
+        self.image = background.copy()
+        self.width, self.height = background.shape[:2]
+
+        self._boxes = {}     # object -> drawn bounding box, or None
+        self._dirty = set()  # objects that changed since the last render
+        self._cells = {}     # (cx, cy) -> objects whose box overlaps the cell
+
+    ###########################################################################
+    # Observer interface
+    ###########################################################################
+
+    def update(self, obj, attribute):
+        """
+        Observer callback, called by objects whenever one of their attributes
+        changes. Marks the object for repainting if its appearance changed.
+
+        Parameters
+        ----------
+        obj : BreakoutObject
+        attribute : str
+            Name of the attribute that changed.
+        """
+        if attribute in ('position', 'nzis', 'visible', 'color'):
+            self._dirty.add(obj)
+
+    def clear(self):
+        """
+        Stop observing the objects drawn in the framebuffer.
+        """
+        for obj in self._boxes:
+            obj.unregister(self)
+
+        self._boxes.clear()
+        self._dirty.clear()
+        self._cells.clear()
+
+    ###########################################################################
+    # Rendering
+    ###########################################################################
+
+    def render(self, objects):
+        """
+        Bring the framebuffer up to date with a set of objects.
+
+        Parameters
+        ----------
+        objects : [BreakoutObject]
+            Objects to draw, in painting order: objects that come later are
+            drawn on top of the ones that come before.
+
+        Returns
+        -------
+        image : numpy.ndarray[:, :, :] (dtype=numpy.uint8)
+            The framebuffer image, shaped (width, height, 3). Not a copy.
+        """
+        dirty_rectangles = []
+        rank = {obj: i for i, obj in enumerate(objects)}
+
+        # Objects that disappeared from the game since the last frame
+        for obj in [obj for obj in self._boxes if obj not in rank]:
+            box = self._boxes.pop(obj)
+            self._unindex(obj, box)
+            dirty_rectangles.append(box)
+            self._dirty.discard(obj)
+            obj.unregister(self)
+
+        # Objects that appeared in the game since the last frame
+        for obj in objects:
+            if obj not in self._boxes:
+                self._boxes[obj] = None
+                self._dirty.add(obj)
+                obj.register(self)
+
+        # Objects that changed since the last frame: repaint both the region
+        # they vacated and the one they now cover.
+        for obj in self._dirty:
+            old_box = self._boxes[obj]
+            self._unindex(obj, old_box)
+            dirty_rectangles.append(old_box)
+
+            self._boxes[obj] = box = self._bounding_box(obj)
+            self._index(obj, box)
+            dirty_rectangles.append(box)
+
+        self._dirty.clear()
+
+        for rectangle in dirty_rectangles:
+            if rectangle is not None:
+                self._repaint(rectangle, rank)
+
+        return self.image
+
+    ###########################################################################
+    # Helper methods
+    ###########################################################################
+
+    def _bounding_box(self, obj):
+        """
+        Bounding box (x_min, x_max, y_min, y_max) of the pixels of an object
+        within the image, upper bounds excluded, or None if nothing is drawn.
+        """
+        if not obj.visible:
+            return None
+
+        x, y = obj.position
+        x_min = max(x + obj.nzis_min[0], 0)
+        x_max = min(x + obj.nzis_max[0] + 1, self.width)
+        y_min = max(y + obj.nzis_min[1], 0)
+        y_max = min(y + obj.nzis_max[1] + 1, self.height)
+
+        if x_min >= x_max or y_min >= y_max:
+            return None
+
+        return x_min, x_max, y_min, y_max
+
+    def _cells_of(self, box):
+        """
+        Cells of the spatial index overlapped by a bounding box.
+        """
+        x_min, x_max, y_min, y_max = box
+        return [(cx, cy)
+                for cx in xrange(x_min // CELL_SIZE,
+                                 (x_max - 1) // CELL_SIZE + 1)
+                for cy in xrange(y_min // CELL_SIZE,
+                                 (y_max - 1) // CELL_SIZE + 1)]
+
+    def _index(self, obj, box):
+        """
+        Add an object to the cells overlapped by its bounding box.
+        """
+        if box is not None:
+            for cell in self._cells_of(box):
+                self._cells.setdefault(cell, set()).add(obj)
+
+    def _unindex(self, obj, box):
+        """
+        Remove an object from the cells overlapped by its bounding box.
+        """
+        if box is not None:
+            for cell in self._cells_of(box):
+                objects = self._cells[cell]
+                objects.discard(obj)
+                if not objects:
+                    del self._cells[cell]
+
+    def _repaint(self, rectangle, rank):
+        """
+        Repaint a rectangle of the image: background first, then every
+        object overlapping it in painting order (given by `rank`), clipped to
+        the rectangle.
+        """
+        x_min, x_max, y_min, y_max = rectangle
+        self.image[x_min:x_max, y_min:y_max] = \
+            self.background[x_min:x_max, y_min:y_max]
+
+        overlapping = set()
+        for cell in self._cells_of(rectangle):
+            for obj in self._cells.get(cell, ()):
+                box = self._boxes[obj]
+
+                if not (box[0] >= x_max or box[1] <= x_min or
+                        box[2] >= y_max or box[3] <= y_min):
+                    overlapping.add(obj)
+
+        for obj in sorted(overlapping, key=rank.__getitem__):
+            box = self._boxes[obj]
+
+            if obj.is_rectangular:
+                self.image[max(box[0], x_min):min(box[1], x_max),
+                           max(box[2], y_min):min(box[3], y_max)] = obj.color
+            else:
+                nzis = np.asarray(obj.offset_nzis).reshape(-1, 2)
+                inside = ((nzis[:, 0] >= x_min) & (nzis[:, 0] < x_max) &
+                          (nzis[:, 1] >= y_min) & (nzis[:, 1] < y_max))
+                self.image[nzis[inside, 0], nzis[inside, 1]] = obj.color
+
+
+class StaticLayer(object):
+    """
+    Cached image of the static objects of the game (walls, bricks, fixed
+    obstacles), on top of which moving objects are painted at each frame.
+
+    The layer registers itself as an observer of the static objects, and is
+    rebuilt from scratch whenever one of them changes, or when the set of
+    static objects itself changes (e.g., a brick is destroyed, or a layout
+    replaces all the bricks). This is simpler than tracking dirty regions,
+    at the cost of one full copy of the layer per frame.
+
+    Parameters
+    ----------
+    background : numpy.ndarray[:, :, :] (dtype=numpy.uint8)
+        Background image, shaped (width, height, 3).
+    render_object : callable
+        Function painting an object in an image in-place, with signature
+        `render_object(image, obj)` (e.g., BreakoutEngine.render_object).
+
+    Attributes
+    ----------
+    layer : numpy.ndarray[:, :, :] (dtype=numpy.uint8)
+        Background and static objects, shaped (width, height, 3).
+    image : numpy.ndarray[:, :, :] (dtype=numpy.uint8)
+        Image of the last rendered frame, shaped (width, height, 3).
+    """
+    def __init__(self, background, render_object):
+        self.background = background.copy()
+        self.layer = background.copy()
+        self.image = background.copy()
+        self.render_object = render_object
+
+        self._objects = []  # static objects painted in the layer
+        self._valid = False
+
+    ###########################################################################
+    # Observer interface
+    ###########################################################################
+
+    def update(self, obj, attribute):
+        """
+        Observer callback, called by objects whenever one of their attributes
+        changes. Invalidates the layer if the appearance of a static object
+        changed.
+
+        Parameters
+        ----------
+        obj : BreakoutObject
+        attribute : str
+            Name of the attribute that changed.
+        """
+        if attribute in ('position', 'nzis', 'visible', 'color'):
+            self._valid = False
+
+    def clear(self):
+        """
+        Stop observing the objects painted in the layer.
+        """
+        for obj in self._objects:
+            obj.unregister(self)
+
+        self._objects = []
+        self._valid = False
+
+    ###########################################################################
+    # Rendering
+    ###########################################################################
+
+    def render(self, static_objects, moving_objects):
+        """
+        Composite the moving objects on top of the (possibly rebuilt) layer.
+
+        Parameters
+        ----------
+        static_objects : [BreakoutObject]
+            Objects cached in the layer, in painting order.
+        moving_objects : [BreakoutObject]
+            Objects painted at each frame on top of the layer, in painting
+            order.
+
+        Returns
+        -------
+        image : numpy.ndarray[:, :, :] (dtype=numpy.uint8)
+            Image of the frame, shaped (width, height, 3). Not a copy.
+        """
+        if not self._valid or static_objects != self._objects:
+            self._rebuild(static_objects)
+
+        np.copyto(self.image, self.layer)
+
+        for obj in moving_objects:
+            self.render_object(self.image, obj)
+
+        return self.image
+
+    def _rebuild(self, static_objects):
+        """
+        Repaint the layer from scratch and observe the new static objects.
+        """
+        self.clear()
+        self.layer[:] = self.background
+
+        for obj in static_objects:
+            self.render_object(self.layer, obj)
+            obj.register(self)
+
+        self._objects = list(static_objects)
+        self._valid = True
@@ -8,7 +8,6 @@ randomizing some game properties across episodes or not.
 """
 
 import numpy as np
-import random
 from itertools import product
 
 from schema_games.breakout.core import BreakoutEngine
@@ -102,21 +101,24 @@ class StandardBreakout(BreakoutEngine):
 
         brick_colors = Brick.brick_colors_classic(len(brick_ys))
 
-        self.bricks = []
+        bricks = []
 
         for x in brick_xs:
             for k, (y, col) in enumerate(zip(brick_ys, brick_colors)):
                 kwargs = {
-                    'reward':   self.brick_reward,
-                    'shape':    self._brick_shape,
-                    'color':    col,
+                    'reward':    self.brick_reward,
+                    'shape':     self._brick_shape,
+                    'color':     col,
+                    'np_random': self.np_random,
                 }
 
                 if k == self.num_bricks_rows - 4 and \
                    self.include_accelerator_bricks:
-                    self.bricks += [AcceleratorBrick((x, y), **kwargs)]
+                    bricks += [AcceleratorBrick((x, y), **kwargs)]
                 else:
-                    self.bricks += [Brick((x, y), **kwargs)]
+                    bricks += [Brick((x, y), **kwargs)]
+
+        self.bricks = bricks
 
     @staticmethod
     def brick_wall_coordinates(height,
@@ -171,8 +173,8 @@ class OffsetPaddleBreakout(StandardBreakout):
         API method. Sets up layers of bricks as usual, and changes the height
         of the paddle randomly.
         """
-        paddle_height = random.randrange(self.min_paddle_height,
-                                         self.max_paddle_height)
+        paddle_height = self.np_random.randint(self.min_paddle_height,
+                                               self.max_paddle_height)
         self.paddle_starting_position = (None, paddle_height)
         super(OffsetPaddleBreakout, self).layout()
 
@@ -194,8 +196,10 @@ class HalfNegativeBreakout(StandardBreakout):
         super(HalfNegativeBreakout, self).layout()
 
         rewards = [-1, 1]
-        brick_colors = random.sample(CLASSIC_BRICK_COLORS, 2)
-        random.shuffle(rewards)
+        brick_colors = [CLASSIC_BRICK_COLORS[i] for i in
+                        self.np_random.choice(len(CLASSIC_BRICK_COLORS), 2,
+                                              replace=False)]
+        self.np_random.shuffle(rewards)
 
         for brick in self.bricks:
             x, _ = brick.position
@@ -222,9 +226,7 @@ class MiddleWallBreakout(StandardBreakout):
         """
         assert wall_location in ('left', 'middle', 'right', None)
         self.wall_location = wall_location
-
-        if self.wall_location is None:
-            self.wall_location = random.choice(('left', 'middle', 'right'))
+        self.randomize_wall_location = wall_location is None
 
         super(MiddleWallBreakout, self).__init__(*args, **kwargs)
 
@@ -236,6 +238,11 @@ class MiddleWallBreakout(StandardBreakout):
         """
         super(MiddleWallBreakout, self).layout()
 
+        if self.randomize_wall_location:
+            locations = ('left', 'middle', 'right')
+            self.wall_location = locations[
+                self.np_random.randint(len(locations))]
+
         _, brick_ys = StandardBreakout.brick_wall_coordinates(
             height=self.height,
             width=self.width,
@@ -324,6 +331,21 @@ class RandomTargetBreakout(StandardBreakout):
         """
         self.bricks, self.block_x, self.block_y = self.get_block_of_bricks()
 
+    def get_state(self):
+        """
+        API method. Also captures the position of the target.
+        """
+        state = super(RandomTargetBreakout, self).get_state()
+        state['block_position'] = (self.block_x, self.block_y)
+        return state
+
+    def set_state(self, state):
+        """
+        API method. Also restores the position of the target.
+        """
+        super(RandomTargetBreakout, self).set_state(state)
+        self.block_x, self.block_y = state['block_position']
+
     def get_block_of_bricks(self):
         """
         Helper method. Creates a block of bricks at the desired location.
@@ -335,8 +357,9 @@ class RandomTargetBreakout(StandardBreakout):
             Position of the target.
         """
         m, n = self.num_bricks
-        block_x = random.randrange(self.x_inf, self.x_sup)
-        block_y = random.choice(self.allowed_ys)
+        block_x = self.np_random.randint(self.x_inf, self.x_sup)
+        block_y = self.allowed_ys[
+            self.np_random.randint(len(self.allowed_ys))]
         block_of_bricks = []
         color_index = self.brick_ys.index(block_y)
 
@@ -346,7 +369,8 @@ class RandomTargetBreakout(StandardBreakout):
                         block_y + j * self._brick_shape[1])
             block_of_bricks += [ResetterBrick(position,
                                               shape=self._brick_shape,
-                                              color=color)]
+                                              color=color,
+                                              np_random=self.np_random)]
 
         return block_of_bricks, block_x, block_y
 
@@ -0,0 +1,255 @@
+"""
+Incremental hashing of the state of a game, e.g. to detect transpositions in
+a tree search. Each game object contributes a 64-bit key derived from its
+mutable attributes (Zobrist-style), and the hash of the game combines these
+keys. Keys are only recomputed for the objects that changed since the hash was
+last requested, so that the cost of a hash does not grow with the number of
+objects (typically, bricks) left untouched.
+
+Keys are derived from the values of the attributes rather than from the
+identity of the objects, so that identical states of two games (or of the same
+game, across resets) have the same hash.
+"""
+
+import zlib
+
+import numpy as np
+
+MASK = (1 << 64) - 1
+
+# Stands for missing or infinite integer attributes in keys
+MISSING = -1
+
+# Attributes of game objects that contribute to their keys
+HASHED_ATTRIBUTES = frozenset(['position', 'nzis', 'visible', 'hitpoints',
+                               'velocity_index', 'velocity'])
+
+
+def mix(value):
+    """
+    SplitMix64 finalizer: scramble a 64-bit integer.
+    """
+    z = (value + 0x9E3779B97F4A7C15) & MASK
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & MASK
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & MASK
+    return z ^ (z >> 31)
+
+
+def combine_keys(*values):
+    """
+    64-bit key of a sequence of integers.
+
+    Parameters
+    ----------
+    *values : int
+
+    Returns
+    -------
+    int
+    """
+    key = 0
+    for value in values:
+        key = mix(key ^ (value & MASK))
+    return key
+
+
+def shape_key(obj):
+    """
+    Key of the kind and shape of a game object, which seldom change.
+
+    Parameters
+    ----------
+    obj : BreakoutObject
+
+    Returns
+    -------
+    int
+    """
+    nzis = np.ascontiguousarray(obj.nzis, dtype=np.int64)
+    return combine_keys(zlib.crc32(type(obj).__name__),
+                        zlib.crc32(nzis.tostring()))
+
+
+def object_key(obj, shape_key):
+    """
+    64-bit key of the mutable state of a game object: its kind and shape (see
+    `shape_key`), position, visibility and hitpoints, and its velocity if it
+    has one.
+
+    Parameters
+    ----------
+    obj : BreakoutObject
+    shape_key : int
+
+    Returns
+    -------
+    int
+    """
+    hitpoints = obj.hitpoints
+    if hitpoints == np.PINF:
+        hitpoints = MISSING
+
+    velocity_index = getattr(obj, 'velocity_index', None)
+    if velocity_index is None:
+        velocity_index = MISSING
+
+    # Velocities may be negative: a flag tells missing velocities apart
+    velocity = getattr(obj, 'velocity', None)
+    if velocity is None:
+        velocity = (MISSING, 0, 0)
+    else:
+        velocity = (1, int(velocity[0]), int(velocity[1]))
+
+    # Only integers are combined: the built-in hash of other values (e.g.,
+    # None under Python 2) may vary across processes
+    x, y = obj.position
+    return combine_keys(shape_key, int(x), int(y), int(obj.visible),
+                        int(hitpoints), int(velocity_index), *velocity)
+
+
+class StateHash(object):
+    """
+    Hash of a set of BreakoutObject instances, maintained incrementally.
+
+    The hash registers itself as an observer of each object it contains:
+    changes only mark the object as outdated, and its key is recomputed upon
+    the next request of the hash. Keys are summed modulo 2 ** 64 rather than
+    XOR-ed, so that identical objects (e.g., balls stacked at their starting
+    position) do not cancel each other out.
+    """
+    def __init__(self):
+        self._keys = {}         # object -> key, or None if outdated
+        self._shape_keys = {}   # object -> shape key, or None if outdated
+        self._outdated = set()
+        self._sum = 0           # sum of the keys that are up to date
+
+    def __contains__(self, obj):
+        return obj in self._keys
+
+    def __len__(self):
+        return len(self._keys)
+
+    @property
+    def objects(self):
+        """
+        Objects currently contributing to the hash.
+
+        Returns
+        -------
+        [BreakoutObject]
+        """
+        return self._keys.keys()
+
+    @property
+    def value(self):
+        """
+        Hash of the objects, as a 64-bit unsigned integer.
+
+        Returns
+        -------
+        int
+        """
+        for obj in self._outdated:
+            if self._shape_keys[obj] is None:
+                self._shape_keys[obj] = shape_key(obj)
+
+            key = object_key(obj, self._shape_keys[obj])
+            self._keys[obj] = key
+            self._sum += key
+
+        self._outdated.clear()
+        self._sum &= MASK
+
+        return self._sum
+
+    def add(self, obj):
+        """
+        Register an object.
+
+        Parameters
+        ----------
+        obj : BreakoutObject
+        """
+        if obj in self._keys:
+            return
+
+        self._keys[obj] = None
+        self._shape_keys[obj] = None
+        self._outdated.add(obj)
+        obj.register(self)
+
+    def discard(self, obj):
+        """
+        Stop tracking an object, if present.
+
+        Parameters
+        ----------
+        obj : BreakoutObject
+        """
+        if obj not in self._keys:
+            return
+
+        self._outdate(obj)
+        self._outdated.discard(obj)
+        del self._keys[obj]
+        del self._shape_keys[obj]
+        obj.unregister(self)
+
+    def clear(self):
+        """
+        Stop tracking all the objects.
+        """
+        for obj in self._keys:
+            obj.unregister(self)
+
+        self._keys.clear()
+        self._shape_keys.clear()
+        self._outdated.clear()
+        self._sum = 0
+
+    def replace(self, old_objects, new_objects):
+        """
+        Swap a group of objects for another one. Objects appearing in both
+        groups are left untouched.
+
+        Parameters
+        ----------
+        old_objects : [BreakoutObject]
+        new_objects : [BreakoutObject]
+        """
+        new_objects_set = set(new_objects)
+
+        for obj in list(old_objects):
+            if obj not in new_objects_set:
+                self.discard(obj)
+
+        for obj in new_objects:
+            self.add(obj)
+
+    def update(self, obj, attribute):
+        """
+        Observer callback, called by objects whenever one of their attributes
+        changes. Marks the object as outdated if its key may have changed.
+
+        Parameters
+        ----------
+        obj : BreakoutObject
+        attribute : str
+            Name of the attribute that changed.
+        """
+        if attribute in HASHED_ATTRIBUTES and obj in self._keys:
+            self._outdate(obj)
+
+            if attribute == 'nzis':
+                self._shape_keys[obj] = None
+
+    def _outdate(self, obj):
+        """
+        Withdraw the key of an object from the sum, to be recomputed.
+        """
+        key = self._keys[obj]
+
+        if key is not None:
+            self._sum -= key
+            self._keys[obj] = None
+            self._outdated.add(obj)
@@ -1,6 +1,5 @@
 import copy
 import numpy as np
-import random
 
 from schema_games.utils import \
     compute_edge_nzis, compute_shape_from_nzis, \
@@ -21,7 +20,8 @@ class BreakoutObject(object):
     Parameters
     ----------
     position : [int, int] or (int, int) or numpy.ndarray
-        Initial position coordinates of the object.
+        Initial position coordinates of the object. Stored, and returned by
+        the `position` property, as a tuple of ints.
     nzis : [(int, int)] or None
         Nonzero indices for the parts/pixels of the object. (0, 0) corresponds
         to object position and is located at the top left corner of the object.
@@ -65,7 +65,31 @@ class BreakoutObject(object):
 
     '_destruction_effect' will be called when a ball collides with this object
     and destroys it.
+
+    Observers
+    ---------
+    Structures that mirror the state of the object (e.g., the engine's
+    occupancy grid) may `register` themselves as observers. Their
+    `update(obj, attribute)` method is then called whenever one of the
+    protected attributes below changes.
+
+    Slots
+    -----
+    Game objects are numerous and created anew at each reset, so they define
+    `__slots__` instead of carrying a `__dict__`. Subclasses must declare the
+    attributes they add in their own `__slots__`.
     """
+    __slots__ = (
+        'observers', '_position', '_nzis', '_color', '_visible', '_hitpoints',
+        'is_entity', 'is_rectangular', 'indirect_collision_effects',
+        'entity_id', 'object_id',
+
+        # Memoized values, see `reset_cache`
+        '_cached_shape', '_cached_offset_nzis', '_cached_offset_edge_nzis',
+        '_cached_nzis_min', '_cached_nzis_max', '_cached_entity_states',
+        '_cached_entity_array',
+    )
+
     unique_entity_id = 0
     unique_object_id = 0
     unique_color_id = 0
@@ -83,11 +107,14 @@ class BreakoutObject(object):
                  visible=True,
                  indirect_collision_effects=True):
 
-        self._position = np.array(position)
-        self.hitpoints = hitpoints
+        x, y = position
+
+        self.observers = []
+        self._position = (int(x), int(y))
+        self._hitpoints = hitpoints
         self.is_entity = is_entity
-        self.color = color
-        self.visible = visible
+        self._color = color
+        self._visible = visible
         self.is_rectangular = True
         self.indirect_collision_effects = indirect_collision_effects
 
@@ -122,13 +149,41 @@ class BreakoutObject(object):
         looks up these properties frequently.
         """
         self._cached_shape = None
-        self._cached_offset_nzis = None
-        self._cached_offset_edge_nzis = None
         self._cached_nzis_min = None
         self._cached_nzis_max = None
+        self.reset_position_cache()
+
+    def reset_position_cache(self):
+        """
+        Reset the cached values that depend on the position of the object but
+        not on its shape, so that moving objects keep their shape caches. The
+        entity states parsed from the object by the engine also depend on its
+        color and visibility, which reset these values as well.
+        """
+        self._cached_offset_nzis = None
+        self._cached_offset_edge_nzis = None
+        self._cached_entity_states = None
+        self._cached_entity_array = None
+
+    ###########################################################################
+    # Observers
+    ###########################################################################
+
+    def register(self, observer):
+        if observer not in self.observers:
+            self.observers.append(observer)
+
+    def unregister(self, observer):
+        if observer in self.observers:
+            self.observers.remove(observer)
+
+    def update_observers(self, attribute):
+        for observer in self.observers:
+            observer.update(self, attribute)
 
     ###########################################################################
-    # Protected attributes: setting any of them triggers a cache refresh
+    # Protected attributes: setting any of them notifies the observers, and
+    # all but the hitpoints trigger a cache refresh
     ###########################################################################
 
     @property
@@ -137,14 +192,14 @@ class BreakoutObject(object):
 
     @position.setter
     def position(self, pos):
-        if all(np.array(pos) == self._position):
+        x, y = pos
+        pos = (int(x), int(y))
+
+        if pos == self._position:
             return
-        try:
-            self._position = np.array(pos)
-        except:
-            raise
-        finally:
-            self.reset_cache()
+        self._position = pos
+        self.reset_position_cache()
+        self.update_observers('position')
 
     @property
     def nzis(self):
@@ -158,6 +213,42 @@ class BreakoutObject(object):
             raise
         finally:
             self.reset_cache()
+        self.update_observers('nzis')
+
+    @property
+    def visible(self):
+        return self._visible
+
+    @visible.setter
+    def visible(self, visible):
+        if visible == self._visible:
+            return
+        self._visible = visible
+        self.reset_position_cache()
+        self.update_observers('visible')
+
+    @property
+    def color(self):
+        return self._color
+
+    @color.setter
+    def color(self, color):
+        if color == self._color:
+            return
+        self._color = color
+        self.reset_position_cache()
+        self.update_observers('color')
+
+    @property
+    def hitpoints(self):
+        return self._hitpoints
+
+    @hitpoints.setter
+    def hitpoints(self, hitpoints):
+        if hitpoints == self._hitpoints:
+            return
+        self._hitpoints = hitpoints
+        self.update_observers('hitpoints')
 
     ###########################################################################
     # Read-only, cached attributes that derived from `nzis`
@@ -314,14 +405,14 @@ class MoveableObject(BreakoutObject):
     """
     Base class for all objects whose position may change.
     """
-    pass
+    __slots__ = ()
 
 
 class MomentumObject(MoveableObject):
     """
     Base class for all objects with action-independent momentum.
     """
-    pass
+    __slots__ = ()
 
 
 ###############################################################################
@@ -331,29 +422,58 @@ class MomentumObject(MoveableObject):
 class Brick(BreakoutObject):
     """
     Base class for Breakout bricks. It has a custom attribute 'reward' that is
-    only accessed within this class.
+    only accessed within this class. Like the protected attributes of game
+    objects, changing it notifies the observers of the brick.
     """
+    __slots__ = ('_reward',)
+
     def __init__(self, *args, **kwargs):
         """
         Parameters
         ----------
         reward : int
             Reward upon collision.
+        np_random : numpy.random.RandomState
+            Random number generator used to draw the color of the brick if
+            none is given, typically that of the environment. Without it,
+            such bricks take the first color of the palette, so that they
+            never draw from the global NumPy generator.
         """
-        kwargs.setdefault('color', random.choice(get_distinct_colors(6)))
+        np_random = kwargs.pop('np_random', None)
+
+        if 'color' not in kwargs:
+            colors = get_distinct_colors(6)
+            if np_random is None:
+                kwargs['color'] = colors[0]
+            else:
+                kwargs['color'] = colors[np_random.randint(len(colors))]
+
         kwargs.setdefault('hitpoints', 1)
         kwargs.setdefault('indirect_collision_effects', False)
-        self.reward = kwargs.pop('reward', 1)
+        reward = kwargs.pop('reward', 1)
 
         super(Brick, self).__init__(*args, **kwargs)
 
+        self._reward = reward
+
+    @property
+    def reward(self):
+        return self._reward
+
+    @reward.setter
+    def reward(self, reward):
+        if reward == self._reward:
+            return
+        self._reward = reward
+        self.update_observers('reward')
+
     def _collision_effect(self, environment):
         self.hitpoints -= 1
 
     def _destruction_effect(self, environment):
         environment.reward += self.reward
         environment.brick_hit_counter += 1
-        environment.bricks.remove(self)
+        environment.remove_brick(self)
 
     @staticmethod
     def brick_colors_classic(num_bricks):
@@ -371,6 +491,8 @@ class StrongBrick(Brick):
     """
     Bricks that take multiple hits to be destroyed.
     """
+    __slots__ = ('init_hitpoints', 'init_color')
+
     def __init__(self, *args, **kwargs):
         kwargs.setdefault('hitpoints', 3)
         super(StrongBrick, self).__init__(*args, **kwargs)
@@ -396,13 +518,15 @@ class StrongBrick(Brick):
     def _destruction_effect(self, environment):
         environment.reward += self.reward
         environment.brick_hit_counter += 1
-        environment.bricks.remove(self)
+        environment.remove_brick(self)
 
 
 class PaddleShrinkingBrick(Brick):
     """
     Bricks that shrink the paddle when hit.
     """
+    __slots__ = ('shrinkage',)
+
     def __init__(self, *args, **kwargs):
         """
         Parameters
@@ -423,13 +547,15 @@ class PaddleShrinkingBrick(Brick):
 
     def _destruction_effect(self, environment):
         environment.brick_hit_counter += 1
-        environment.bricks.remove(self)
+        environment.remove_brick(self)
 
 
 class PaddleGrowingBrick(Brick):
     """
     Bricks that grow the paddle when hit.
     """
+    __slots__ = ('growth',)
+
     def __init__(self, *args, **kwargs):
         """
         Parameters
@@ -451,13 +577,15 @@ class PaddleGrowingBrick(Brick):
 
     def _destruction_effect(self, environment):
         environment.brick_hit_counter += 1
-        environment.bricks.remove(self)
+        environment.remove_brick(self)
 
 
 class AcceleratorBrick(Brick):
     """
     Bricks that permanently accelerate the ball when hit.
     """
+    __slots__ = ()
+
     trigger_counter = _MAX_SPEED - 1
 
     def __init__(self, *args, **kwargs):
@@ -477,7 +605,7 @@ class AcceleratorBrick(Brick):
     def _destruction_effect(self, environment):
         environment.reward += self.reward
         environment.brick_hit_counter += 1
-        environment.bricks.remove(self)
+        environment.remove_brick(self)
 
 
 class ResetterBrick(Brick):
@@ -485,6 +613,8 @@ class ResetterBrick(Brick):
     Upon collision, this brick yields some reward and then calls the
     environment's layout function again to reset the game.
     """
+    __slots__ = ()
+
     def __init__(self, *args, **kwargs):
         super(ResetterBrick, self).__init__(*args, **kwargs)
 
@@ -505,6 +635,8 @@ class Paddle(BreakoutObject):
     Paddle. Note that ball-paddle collisions will *not* trigger a call of
     Paddle._collision_effect!
     """
+    __slots__ = ()
+
     def __init__(self, *args, **kwargs):
         kwargs.setdefault('color', DEFAULT_PADDLE_COLOR)
         super(Paddle, self).__init__(*args, **kwargs)
@@ -529,8 +661,11 @@ class Paddle(BreakoutObject):
 class Ball(MomentumObject):
     """
     Ball. Unlike MomentumObject, it has a special attribute, velocity_index,
-    that determines its velocity.
+    that determines its velocity. Changing it notifies the observers of the
+    ball.
     """
+    __slots__ = ('_velocity_index',)
+
     def __init__(self, *args, **kwargs):
         kwargs.setdefault('color', CLASSIC_BALL_COLOR)
 
@@ -538,23 +673,54 @@ class Ball(MomentumObject):
         assert not {'shape', 'nzis'}.intersection(kwargs.keys())
         kwargs['shape'] = _BALL_SHAPE
         kwargs['nzis'] = None
-        self.velocity_index = kwargs.pop('velocity_index', None)
+        self._velocity_index = kwargs.pop('velocity_index', None)
 
         super(Ball, self).__init__(*args, **kwargs)
 
+    @property
+    def velocity_index(self):
+        return self._velocity_index
+
+    @velocity_index.setter
+    def velocity_index(self, velocity_index):
+        if velocity_index == self._velocity_index:
+            return
+        self._velocity_index = velocity_index
+        self.update_observers('velocity_index')
+
 
 class Wall(BreakoutObject):
     """
     Wall. It has shape (1, 1) by default.
     """
+    __slots__ = ('pixel_entities',)
+
     def __init__(self, *args, **kwargs):
+        """
+        Parameters
+        ----------
+        pixel_entities : {(int, int): int} or None
+            If not None, the wall is reported as though it were made of
+            separate one-pixel walls: each nzi in this mapping is reported as
+            an entity of shape (1, 1) with the associated entity ID, and the
+            wall itself does not consume an entity ID. This allows large
+            walls (e.g., the environment borders) to be represented by a
+            single object without changing the reported entities.
+        """
         kwargs.setdefault('color', CLASSIC_WALL_COLOR)
+        self.pixel_entities = kwargs.pop('pixel_entities', None)
 
         if 'nzis' not in kwargs and 'shape' not in kwargs:
             kwargs['nzis'] = [(0, 0)]
 
+        if self.pixel_entities is not None:
+            kwargs['is_entity'] = False
+
         super(Wall, self).__init__(*args, **kwargs)
 
+        if self.pixel_entities is not None:
+            self.is_entity = bool(self.pixel_entities)
+
         # Things get complicated if walls can be invisible. Protect this.
         assert self.visible
 
@@ -565,6 +731,8 @@ class PaddleShrinkingWall(Wall):
     a class attribute 'trigger_count' to make sure that the effect be triggered
     only once.
     """
+    __slots__ = ()
+
     trigger_count = False
 
     def __init__(self, *args, **kwargs):
@@ -585,6 +753,8 @@ class WallOfPunishment(Wall):
     agents. Note that no collision effects are triggered and that rewards are
     handled by the engine normally.
     """
+    __slots__ = ()
+
     def __init__(self, *args, **kwargs):
         """
         No need to do anything here, the reward is handled below.
@@ -600,8 +770,11 @@ class WallOfPunishment(Wall):
 class HorizontallyMovingObstacle(MomentumObject):
     """
     Wall that bounces back and forth. Note that velocity is encoded differently
-    than the ball, which is a special case.
+    than the ball, which is a special case. Changing the velocity notifies the
+    observers of the obstacle.
     """
+    __slots__ = ('_velocity',)
+
     def __init__(self, *args, **kwargs):
         """
         Parameters
@@ -609,6 +782,17 @@ class HorizontallyMovingObstacle(MomentumObject):
         velocity : (int, int)
             Initial velocity of the object.
         """
-        self.velocity = kwargs.pop('velocity')
+        self._velocity = kwargs.pop('velocity')
         assert self.velocity[1] == 0
         super(HorizontallyMovingObstacle, self).__init__(*args, **kwargs)
+
+    @property
+    def velocity(self):
+        return self._velocity
+
+    @velocity.setter
+    def velocity(self, velocity):
+        if velocity == self._velocity:
+            return
+        self._velocity = velocity
+        self.update_observers('velocity')
@@ -0,0 +1,343 @@
+"""
+Incrementally maintained occupancy grid. Rather than rebuilding the set of
+pixels covered by every object at each timestep, the engine keeps a 2D label
+grid that is only updated when an object moves, changes shape, becomes
+(in)visible, or is added to / removed from the game. The grid doubles as a
+per-pixel spatial index to retrieve the objects covering a given position.
+"""
+
+import numpy as np
+
+
+class OccupancyGrid(object):
+    """
+    2D label grid of the pixels covered by a set of BreakoutObject instances,
+    indexed in the game's native (x, y) coordinates.
+
+    The grid registers itself as an observer of each object it contains, so
+    that position, shape and visibility changes are reflected in place at a
+    cost proportional to the size of the object, not of the board.
+
+    Parameters
+    ----------
+    width : int
+        Width of the game.
+    height : int
+        Height of the game.
+
+    Attributes
+    ----------
+    labels : numpy.ndarray[:, :] (dtype=numpy.int32)
+        Label of the last painted object covering each pixel, or
+        OccupancyGrid.EMPTY if no visible object covers it.
+    counts : numpy.ndarray[:, :] (dtype=numpy.int32)
+        Number of visible objects covering each pixel.
+    """
+    EMPTY = -1
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.labels = np.full((width, height), self.EMPTY, dtype=np.int32)
+        self.counts = np.zeros((width, height), dtype=np.int32)
+
+        self._next_label = 0
+        self._labels = {}       # object -> label
+        self._objects = {}      # label -> object
+        self._footprints = {}   # label -> index of the painted pixels
+        self._stacks = {}       # (x, y) -> [label] if covered more than once
+
+    def __contains__(self, obj):
+        return obj in self._labels
+
+    def __len__(self):
+        return len(self._objects)
+
+    @property
+    def objects(self):
+        """
+        Objects currently registered in the grid.
+
+        Returns
+        -------
+        [BreakoutObject]
+        """
+        return self._objects.values()
+
+    ###########################################################################
+    # Registration
+    ###########################################################################
+
+    def add(self, obj):
+        """
+        Register an object and paint its pixels in the grid.
+
+        Parameters
+        ----------
+        obj : BreakoutObject
+        """
+        if obj in self._labels:
+            return
+
+        label = self._next_label
+        self._next_label += 1
+
+        self._labels[obj] = label
+        self._objects[label] = obj
+        self._footprints[label] = self._paint(label, obj)
+        obj.register(self)
+
+    def discard(self, obj):
+        """
+        Erase an object from the grid and stop tracking it, if present.
+
+        Parameters
+        ----------
+        obj : BreakoutObject
+        """
+        label = self._labels.pop(obj, None)
+
+        if label is None:
+            return
+
+        self._erase(label)
+        del self._objects[label]
+        del self._footprints[label]
+        obj.unregister(self)
+
+    def clear(self):
+        """
+        Stop tracking all the objects in the grid.
+        """
+        for obj in self._objects.values():
+            obj.unregister(self)
+
+        self.labels[:] = self.EMPTY
+        self.counts[:] = 0
+        self._labels.clear()
+        self._objects.clear()
+        self._footprints.clear()
+        self._stacks.clear()
+
+    def replace(self, old_objects, new_objects):
+        """
+        Convenience method to swap a group of objects for another one, e.g.
+        when the list of bricks of the game is reassigned. Objects appearing
+        in both groups are left untouched.
+
+        Parameters
+        ----------
+        old_objects : [BreakoutObject]
+        new_objects : [BreakoutObject]
+        """
+        new_objects_set = set(new_objects)
+
+        for obj in list(old_objects):
+            if obj not in new_objects_set:
+                self.discard(obj)
+
+        for obj in new_objects:
+            self.add(obj)
+
+    def update(self, obj, attribute):
+        """
+        Observer callback, called by objects whenever one of their attributes
+        changes. Repaints the object if its footprint may have changed.
+
+        Parameters
+        ----------
+        obj : BreakoutObject
+        attribute : str
+            Name of the attribute that changed.
+        """
+        if attribute not in ('position', 'nzis', 'visible'):
+            return
+
+        label = self._labels.get(obj)
+
+        if label is not None:
+            self._erase(label)
+            self._footprints[label] = self._paint(label, obj)
+
+    ###########################################################################
+    # Queries
+    ###########################################################################
+
+    def label_of(self, obj):
+        """
+        Label of a registered object, or None if it is not tracked.
+        """
+        return self._labels.get(obj)
+
+    def is_occupied(self, position):
+        """
+        Is that position covered by any visible object in the grid?
+
+        Parameters
+        ----------
+        position : (int, int)
+
+        Returns
+        -------
+        bool
+        """
+        x, y = position
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return False
+        return self.counts[x, y] > 0
+
+    def objects_at(self, position):
+        """
+        Spatial index query: retrieve the visible objects covering a position.
+        The cost of a query does not depend on the number of objects.
+
+        Parameters
+        ----------
+        position : (int, int)
+
+        Returns
+        -------
+        [BreakoutObject]
+            Objects covering that position, in the order in which they were
+            last painted there: an object moves to the end of the list
+            whenever it is repainted (e.g., when it moves or changes shape).
+        """
+        x, y = position
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return []
+
+        count = self.counts[x, y]
+        if count == 0:
+            return []
+        elif count == 1:
+            return [self._objects[self.labels[x, y]]]
+        else:
+            return [self._objects[label] for label in self._stacks[(x, y)]]
+
+    def overlaps(self, obj, position):
+        """
+        Would an object overlap any other visible object in the grid, if it
+        were moved to some position? The object itself need not be in the
+        grid; if it is, its own pixels are ignored. Pixels outside of the game
+        never overlap anything.
+
+        Parameters
+        ----------
+        obj : BreakoutObject
+        position : (int, int)
+            Hypothetical position of the object.
+
+        Returns
+        -------
+        bool
+        """
+        pixels = self._pixels(obj, position)
+
+        # Lift the object's own footprint while counting
+        label = self._labels.get(obj)
+        if label is not None:
+            footprint = self._footprints[label]
+            self.counts[footprint] -= 1
+
+        try:
+            return bool(self.counts[pixels].any())
+        finally:
+            if label is not None:
+                self.counts[footprint] += 1
+
+    ###########################################################################
+    # Helper methods
+    ###########################################################################
+
+    def _pixels(self, obj, position):
+        """
+        Index of the pixels covered by an object at some position, clipped to
+        the game. Rectangular objects (see `BreakoutObject.is_rectangular`)
+        are indexed by a pair of slices, which is much cheaper than indexing
+        their pixels one by one; other objects by their coordinates arrays.
+        """
+        if obj.is_rectangular:
+            x, y = position
+            x_min, y_min = obj.nzis_min
+            x_max, y_max = obj.nzis_max
+
+            def clip(value, size):
+                return min(max(value, 0), size)
+
+            return (slice(clip(x + x_min, self.width),
+                          clip(x + x_max + 1, self.width)),
+                    slice(clip(y + y_min, self.height),
+                          clip(y + y_max + 1, self.height)))
+
+        nzis = np.asarray(obj.nzis).reshape(-1, 2)
+        xs = nzis[:, 0] + position[0]
+        ys = nzis[:, 1] + position[1]
+
+        inside = ((xs >= 0) & (xs < self.width) &
+                  (ys >= 0) & (ys < self.height))
+
+        return xs[inside], ys[inside]
+
+    def _coordinates(self, pixels):
+        """
+        Coordinates arrays of the pixels of an index returned by `_pixels`.
+        """
+        if isinstance(pixels[0], slice):
+            xs, ys = np.mgrid[pixels]
+            return xs.ravel(), ys.ravel()
+        else:
+            return pixels
+
+    def _paint(self, label, obj):
+        """
+        Paint the pixels of an object with its label and return the index of
+        the painted pixels (see `_pixels`). Pixels outside of the game are
+        ignored.
+        """
+        if not obj.visible:
+            return np.array([], dtype=int), np.array([], dtype=int)
+
+        pixels = self._pixels(obj, obj.position)
+
+        # Fast path: no other object covers these pixels
+        if not self.counts[pixels].any():
+            self.labels[pixels] = label
+            self.counts[pixels] += 1
+            return pixels
+
+        xs, ys = self._coordinates(pixels)
+        shared = self.counts[xs, ys] > 0
+        for x, y in zip(xs[shared], ys[shared]):
+            stack = self._stacks.setdefault((x, y), [self.labels[x, y]])
+            stack.append(label)
+
+        self.labels[xs, ys] = label
+        self.counts[xs, ys] += 1
+
+        return pixels
+
+    def _erase(self, label):
+        """
+        Erase the pixels painted for some label, restoring the label of any
+        other object covering the same pixels.
+        """
+        pixels = self._footprints[label]
+
+        # Fast path: no other object covers these pixels
+        counts = self.counts[pixels]
+        if counts.size == 0 or counts.max() == 1:
+            self.labels[pixels] = self.EMPTY
+            self.counts[pixels] -= 1
+            return
+
+        xs, ys = self._coordinates(pixels)
+        shared = self.counts[xs, ys] > 1
+        self.counts[xs, ys] -= 1
+        self.labels[xs[~shared], ys[~shared]] = self.EMPTY
+
+        for x, y in zip(xs[shared], ys[shared]):
+            stack = self._stacks[(x, y)]
+            stack.remove(label)
+            self.labels[x, y] = stack[-1]
+            if len(stack) == 1:
+                del self._stacks[(x, y)]
@@ -0,0 +1,105 @@
+"""
+Lightweight instrumentation of the engine: accumulate the wall time spent in,
+and the number of calls of, named sections of code (e.g., the phases of
+`BreakoutEngine._step`), to find out where the time goes without running a
+full profiler.
+"""
+
+from contextlib import contextmanager
+from timeit import default_timer
+
+
+class StepProfiler(object):
+    """
+    Accumulator of wall time and call counts per named section.
+
+    Attributes
+    ----------
+    stats : {str: [float, int]}
+        Total wall time (in seconds) and number of calls of each section.
+    """
+    def __init__(self):
+        self.stats = {}
+
+    clock = staticmethod(default_timer)
+
+    def record(self, name, start):
+        """
+        Record one call of a section.
+
+        Parameters
+        ----------
+        name : str
+            Name of the section.
+        start : float
+            Time at which the section started, as returned by `clock`.
+        """
+        elapsed = default_timer() - start
+        stat = self.stats.get(name)
+
+        if stat is None:
+            self.stats[name] = [elapsed, 1]
+        else:
+            stat[0] += elapsed
+            stat[1] += 1
+
+    @contextmanager
+    def section(self, name):
+        """
+        Context manager recording one call of a section.
+
+        Parameters
+        ----------
+        name : str
+            Name of the section.
+        """
+        start = default_timer()
+        try:
+            yield
+        finally:
+            self.record(name, start)
+
+    def reset(self):
+        """
+        Discard all the accumulated statistics.
+        """
+        self.stats.clear()
+
+    def summary(self):
+        """
+        Accumulated statistics.
+
+        Returns
+        -------
+        {str: {'total_time': float, 'calls': int, 'mean_time': float}}
+            Statistics of each section, times in seconds.
+        """
+        return {name: {'total_time': total_time,
+                       'calls': calls,
+                       'mean_time': total_time / calls}
+                for name, (total_time, calls) in self.stats.iteritems()}
+
+    def __str__(self):
+        lines = ["{:<40s} {:>10s} {:>10s} {:>12s}".format(
+            'section', 'calls', 'total (s)', 'mean (us)')]
+
+        for name, (total_time, calls) in sorted(
+                self.stats.iteritems(), key=lambda item: -item[1][0]):
+            lines.append("{:<40s} {:>10d} {:>10.3f} {:>12.1f}".format(
+                name, calls, total_time, 1e6 * total_time / calls))
+
+        return '\n'.join(lines)
+
+
+class _NullSection(object):
+    """
+    Context manager doing nothing, used when profiling is disabled.
+    """
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_SECTION = _NullSection()
@@ -0,0 +1,274 @@
+"""
+Parallel rollouts of the Breakout game variants. Episodes are sharded across a
+pool of worker processes, each of which builds its environment once and
+reuses it for all the episodes it runs, and results are streamed back as
+episodes complete.
+
+Some effects of the games only trigger a limited number of times over the
+lifetime of an environment (see `BallAcceleratesEvent`, `AcceleratorBrick`
+and `PaddleShrinkingWall`). Their trigger counters are restored at the start
+of each episode, so that every episode plays like the first episode of a
+freshly built environment.
+"""
+
+import argparse
+import multiprocessing
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from schema_games.breakout import games
+from schema_games.breakout.core import BreakoutEngine
+from schema_games.breakout.objects import AcceleratorBrick, PaddleShrinkingWall
+from schema_games.printing import blue
+
+EpisodeResult = namedtuple('EpisodeResult', [
+    'episode',       # index of the episode
+    'total_reward',  # sum of the rewards collected during the episode
+    'length',        # number of steps
+    'transitions',   # [(observation, action, reward, next_observation, done)]
+                     # if transitions are recorded, None otherwise
+])
+
+# Environment and rollout parameters of the current worker process
+_worker = {}
+
+
+###############################################################################
+# Policies
+###############################################################################
+
+def random_policy(observation):
+    """
+    Policy choosing actions uniformly at random.
+
+    Parameters
+    ----------
+    observation : numpy.ndarray or dict
+        Observation returned by the environment.
+
+    Returns
+    -------
+    action : int
+    """
+    return np.random.randint(len(BreakoutEngine.ACTIONS))
+
+
+###############################################################################
+# Rollouts
+###############################################################################
+
+def run_rollouts(game,
+                 num_episodes,
+                 policy=random_policy,
+                 game_kwargs=None,
+                 num_workers=None,
+                 record_transitions=False,
+                 max_steps=None,
+                 seed=None):
+    """
+    Run episodes of a game variant in parallel over a pool of processes.
+
+    Parameters
+    ----------
+    game : str
+        Game variant, specified as a class name in schema_games.breakout.games.
+    num_episodes : int
+        Number of episodes to run.
+    policy : callable
+        Function mapping an observation to an action. Sent to the workers, so
+        it must be picklable (e.g., defined at the top level of a module).
+    game_kwargs : dict or None
+        Keyword arguments passed to the game constructor.
+    num_workers : int or None
+        Number of worker processes. Defaults to the number of CPUs.
+    record_transitions : bool
+        If True, each result includes the transitions of its episode.
+    max_steps : int or None
+        If not None, episodes are truncated after that many steps.
+    seed : int or None
+        If not None, the environment (see `BreakoutEngine.seed`) and the
+        NumPy generator used by the policy are seeded at the start of each
+        episode with `seed + episode`. Along with the trigger counters
+        restored at the start of each episode, this makes every episode
+        reproducible regardless of the worker that runs it, and of the
+        episodes that worker ran before.
+
+    Yields
+    ------
+    EpisodeResult
+        Results of the episodes, in order of completion.
+    """
+    game_class = getattr(games, game)
+    game_kwargs = {} if game_kwargs is None else game_kwargs
+    initargs = (game_class, game_kwargs, policy, record_transitions,
+                max_steps, seed)
+
+    pool = multiprocessing.Pool(num_workers,
+                                initializer=_init_worker,
+                                initargs=initargs)
+
+    try:
+        for result in pool.imap_unordered(_run_episode, xrange(num_episodes)):
+            yield result
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+def run_episode(env, policy, record_transitions=False, max_steps=None):
+    """
+    Run a single episode in an environment.
+
+    Parameters
+    ----------
+    env : BreakoutEngine
+    policy : callable
+        Function mapping an observation to an action.
+    record_transitions : bool
+        If True, return the transitions of the episode.
+    max_steps : int or None
+        If not None, the episode is truncated after that many steps.
+
+    Returns
+    -------
+    total_reward : float
+    length : int
+    transitions : [(observation, action, reward, next_observation, done)]
+        or None if transitions are not recorded.
+    """
+    observation = env.reset()
+    transitions = [] if record_transitions else None
+    total_reward = 0.
+    length = 0
+    done = False
+
+    while not done and (max_steps is None or length < max_steps):
+        action = policy(observation)
+        next_observation, reward, done, _ = env.step(action)
+
+        if record_transitions:
+            transitions.append(
+                (observation, action, reward, next_observation, done))
+
+        observation = next_observation
+        total_reward += reward
+        length += 1
+
+    return total_reward, length, transitions
+
+
+def _init_worker(game_class, game_kwargs, policy, record_transitions,
+                 max_steps, seed):
+    """
+    Pool initializer: build the environment of the worker process once.
+    """
+    _worker['env'] = game_class(**game_kwargs)
+    _worker['trigger_counters'] = _get_trigger_counters(_worker['env'])
+    _worker['policy'] = policy
+    _worker['record_transitions'] = record_transitions
+    _worker['max_steps'] = max_steps
+    _worker['seed'] = seed
+
+
+def _run_episode(episode):
+    """
+    Pool task: run one episode with the environment of the worker process.
+    """
+    _set_trigger_counters(_worker['env'], _worker['trigger_counters'])
+
+    if _worker['seed'] is not None:
+        _worker['env'].seed(_worker['seed'] + episode)
+        np.random.seed(_worker['seed'] + episode)
+
+    total_reward, length, transitions = run_episode(
+        _worker['env'], _worker['policy'],
+        record_transitions=_worker['record_transitions'],
+        max_steps=_worker['max_steps'])
+
+    return EpisodeResult(episode, total_reward, length, transitions)
+
+
+def _get_trigger_counters(env):
+    """
+    Counters of the effects that only trigger a limited number of times over
+    the lifetime of an environment: those of its conditional events, and the
+    ones shared by all the accelerator bricks and paddle-shrinking walls.
+    """
+    return ([event.__dict__.copy() for event in env.conditional_events],
+            AcceleratorBrick.trigger_counter,
+            PaddleShrinkingWall.trigger_count)
+
+
+def _set_trigger_counters(env, trigger_counters):
+    """
+    Restore counters returned by `_get_trigger_counters`.
+    """
+    events, accelerator_trigger_counter, paddle_shrinking_trigger_count = \
+        trigger_counters
+
+    for event, attributes in zip(env.conditional_events, events):
+        event.__dict__.update(attributes)
+
+    AcceleratorBrick.trigger_counter = accelerator_trigger_counter
+    PaddleShrinkingWall.trigger_count = paddle_shrinking_trigger_count
+
+
+if __name__ == '__main__':
+    """
+    Command line interface.
+    """
+    parser = argparse.ArgumentParser(
+        description='Run random rollouts of a breakout game variant in '
+                    'parallel.',
+        usage='rollouts.py [<Game>] [--episodes N] [--workers N] [--seed N]')
+
+    parser.add_argument(
+        'game',
+        default='StandardBreakout',
+        type=str,
+        help="Game variant specified as class name."
+    )
+
+    parser.add_argument(
+        '--episodes',
+        dest='num_episodes',
+        default=16,
+        type=int,
+        help="Number of episodes."
+    )
+
+    parser.add_argument(
+        '--workers',
+        dest='num_workers',
+        default=None,
+        type=int,
+        help="Number of worker processes (default: number of CPUs)."
+    )
+
+    parser.add_argument(
+        '--seed',
+        dest='seed',
+        default=None,
+        type=int,
+        help="Seed of the episodes."
+    )
+
+    args = parser.parse_args()
+
+    start = time.time()
+    num_steps = 0
+
+    for result in run_rollouts(args.game, args.num_episodes,
+                               num_workers=args.num_workers, seed=args.seed):
+        num_steps += result.length
+        print "Episode {:4d}: return {:6.1f}, length {:6d}".format(
+            result.episode, result.total_reward, result.length)
+
+    duration = time.time() - start
+    print blue("{} episodes, {} steps in {:.1f}s ({:.0f} steps/s)".format(
+        args.num_episodes, num_steps, duration, num_steps / duration))
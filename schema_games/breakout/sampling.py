@@ -0,0 +1,172 @@
+"""
+Random variates drawn by blocks. Each call to a NumPy random number generator
+costs a few microseconds of overhead, regardless of the number of variates it
+returns, which adds up when the engine draws several variates per timestep.
+The samplers below draw them by blocks instead, and hand them out one by one.
+
+Samplers do not hold a reference to the generator they draw from: it is passed
+at each draw, so that reseeding the environment (which replaces its
+generator) or copying it does not leave a sampler bound to a stale generator.
+"""
+
+import numpy as np
+
+DEFAULT_BLOCK_SIZE = 1024
+
+
+class AliasTable(object):
+    """
+    Alias table of a discrete distribution (Vose's method), from which any
+    number of outcomes is drawn with two uniform variates each, in constant
+    time regardless of the number of outcomes.
+
+    Parameters
+    ----------
+    probabilities : [float]
+        Probability of each outcome. Must sum to 1.
+
+    Attributes
+    ----------
+    prob : numpy.ndarray[:] (dtype=float)
+        Probability of keeping each outcome once its column is drawn.
+    alias : numpy.ndarray[:] (dtype=int)
+        Outcome drawn instead when it is not kept.
+    """
+    def __init__(self, probabilities):
+        probabilities = np.asarray(probabilities, dtype=float)
+        n = len(probabilities)
+        scaled = list(probabilities * n)
+
+        self.prob = np.ones(n)
+        self.alias = np.arange(n)
+
+        small = [i for i, p in enumerate(scaled) if p < 1.]
+        large = [i for i, p in enumerate(scaled) if p >= 1.]
+
+        while small and large:
+            i, j = small.pop(), large.pop()
+            self.prob[i] = scaled[i]
+            self.alias[i] = j
+            scaled[j] -= 1. - scaled[i]
+
+            if scaled[j] < 1.:
+                small.append(j)
+            else:
+                large.append(j)
+
+        # Leftovers only differ from 1 by rounding errors
+        for i in small + large:
+            self.prob[i] = 1.
+
+    def sample(self, np_random, size):
+        """
+        Draw outcomes.
+
+        Parameters
+        ----------
+        np_random : numpy.random.RandomState
+        size : int
+            Number of outcomes to draw.
+
+        Returns
+        -------
+        numpy.ndarray[:] (dtype=int)
+            Indices of the outcomes.
+        """
+        columns = np_random.randint(len(self.prob), size=size)
+        coins = np_random.random_sample(size)
+
+        return np.where(coins < self.prob[columns],
+                        columns, self.alias[columns])
+
+
+class BlockSampler(object):
+    """
+    Base class for buffers of random variates refilled by blocks. Subclasses
+    implement `_draw_block`.
+
+    Parameters
+    ----------
+    block_size : int
+        Number of variates drawn at once.
+    """
+    def __init__(self, block_size=DEFAULT_BLOCK_SIZE):
+        self.block_size = block_size
+        self.clear()
+
+    def clear(self):
+        """
+        Discard the variates drawn but not handed out yet, e.g. when the
+        generator is reseeded.
+        """
+        self._block = []
+        self._index = 0
+
+    def next(self, np_random):
+        """
+        Next variate, drawing a new block from a generator if needed.
+
+        Parameters
+        ----------
+        np_random : numpy.random.RandomState
+        """
+        if self._index == len(self._block):
+            self._block = self._draw_block(np_random, self.block_size)
+            self._index = 0
+
+        value = self._block[self._index]
+        self._index += 1
+
+        return value
+
+    def get_state(self):
+        """
+        State of the buffer, to be restored with `set_state`. Blocks are never
+        modified in place, so the state is not a copy.
+        """
+        return self._block, self._index
+
+    def set_state(self, state):
+        """
+        Restore a state returned by `get_state`.
+        """
+        self._block, self._index = state
+
+    def _draw_block(self, np_random, size):
+        """
+        Draw a block of variates, returned as a list.
+        """
+        raise NotImplementedError
+
+
+class UniformSampler(BlockSampler):
+    """
+    Variates uniformly distributed over [0, 1).
+    """
+    def _draw_block(self, np_random, size):
+        return np_random.random_sample(size).tolist()
+
+
+class DiscreteSampler(BlockSampler):
+    """
+    Variates following a discrete distribution, drawn with an alias table.
+
+    Parameters
+    ----------
+    values : [object]
+        Outcomes of the distribution.
+    probabilities : [float]
+        Probability of each outcome.
+    block_size : int
+        See BlockSampler.
+    """
+    def __init__(self, values, probabilities,
+                 block_size=DEFAULT_BLOCK_SIZE):
+        assert len(values) == len(probabilities)
+        self.values = list(values)
+        self.alias_table = AliasTable(probabilities)
+        super(DiscreteSampler, self).__init__(block_size)
+
+    def _draw_block(self, np_random, size):
+        return [self.values[i]
+                for i in self.alias_table.sample(np_random, size)]
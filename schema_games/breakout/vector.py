@@ -0,0 +1,729 @@
+"""
+Vectorized Breakout engine. A batch of N independent games is stored as
+struct-of-arrays (balls, paddles, brick masks, counters) and advanced in
+lockstep with batched NumPy operations, so that throughput scales with N
+instead of being bound by per-object Python code.
+
+The static layout (walls, bricks, colors), the velocity tables and the paddle
+response function are read from an instance of the corresponding scalar game,
+so that both engines share the same definitions.
+"""
+
+import numpy as np
+
+from schema_games.breakout.constants import _MAX_SPEED
+from schema_games.breakout.core import ResetHasNeverBeenCalledError
+from schema_games.breakout.events import BallAcceleratesEvent
+from schema_games.breakout.games import JugglingBreakout, StandardBreakout
+from schema_games.breakout.objects import \
+    AcceleratorBrick, Brick, MomentumObject, WallOfPunishment
+
+
+class VectorBreakoutEngine(object):
+    """
+    Batch of N Breakout games stepped at once.
+
+    Supported games are StandardBreakout and JugglingBreakout (including
+    their constructor parameters), with the same physics as BreakoutEngine:
+    ball bounces, paddle response function, bounce stochasticity, paddle
+    speed noise, accelerator bricks, ball acceleration events, lives and
+    rewards. Two simplifications apply:
+
+        - observations are images only (no entity states);
+        - the number of times accelerator bricks may speed up the ball is
+          counted per game and per episode, rather than per process.
+
+    As in BreakoutEngine, each ball acceleration event triggers at most once
+    per game over the lifetime of the engine, not once per episode.
+
+    Games that are done are automatically reset at the end of `step`, so the
+    observation returned for them is the first frame of the new episode.
+
+    Parameters
+    ----------
+    game_class : type
+        StandardBreakout or JugglingBreakout.
+    num_envs : int
+        Number of games N in the batch.
+    seed : int or None
+        Seed of the random number generator shared by the batch.
+    render_images : bool
+        If False, the games are not rendered and `reset` and `step` return
+        None instead of images, which saves time and memory on large batches.
+    **kwargs
+        Keyword arguments passed to `game_class`.
+    """
+    ACTIONS = NOOP, LEFT, RIGHT = range(3)
+    SUPPORTED_GAMES = (StandardBreakout, JugglingBreakout)
+
+    def __init__(self, game_class, num_envs, seed=None, render_images=True,
+                 **kwargs):
+        if game_class not in self.SUPPORTED_GAMES:
+            raise ValueError("Unsupported game: {}".format(game_class))
+
+        self.num_envs = num_envs
+        self.render_images = render_images
+        self.np_random = np.random.RandomState(seed)
+        self.reset_has_never_been_called = True
+
+        # Template game, used to read the layout and physics definitions
+        template = game_class(**kwargs)
+        template.reset()
+
+        self.action_space = template.action_space
+        self.observation_space = template.observation_space
+
+        self.width = template.width
+        self.height = template.height
+        self.wall_thickness = template.wall_thickness
+        self.num_balls = template.num_balls
+        self.initial_num_lives = template.reset_mutables['num_lives']
+        self.starting_ball_movement_radius = \
+            template.reset_mutables['_ball_movement_radius']
+        self.bounce_stochasticity = template.bounce_stochasticity
+        self.reward_upon_ball_loss = template.reward_upon_ball_loss
+        self.reward_upon_no_bricks_left = template.reward_upon_no_bricks_left
+        self.can_run_out_of_bricks = not isinstance(template, JugglingBreakout)
+
+        self._setup_layout(template)
+        self._setup_paddle(template)
+        self._setup_physics_tables(template)
+        self._setup_events(template)
+        self._setup_rendering()
+
+        # Flat (env, ball) indices used by all the per-ball computations
+        self._ball_env = np.repeat(np.arange(self.num_envs), self.num_balls)
+
+    ###########################################################################
+    # Setup
+    ###########################################################################
+
+    def _setup_layout(self, template):
+        """
+        Static occupancy and image of the walls, and label grid of the bricks.
+        """
+        if any(isinstance(obj, MomentumObject)
+               for obj in template.miscellaneous):
+            raise NotImplementedError("Moving obstacles are not supported.")
+
+        if template.frameskip != 1:
+            raise NotImplementedError("Frame skipping is not supported.")
+
+        shape = (self.width, self.height)
+
+        self.static_occupancy = np.zeros(shape, dtype=bool)
+        self.static_image = template.get_background_image()
+
+        for obj in template.walls + template.miscellaneous:
+            if not obj.visible:
+                continue
+            xs, ys = np.array(obj.offset_nzis).T
+            if not isinstance(obj, WallOfPunishment):
+                self.static_occupancy[xs, ys] = True
+            template.render_object(self.static_image, obj)
+
+        # Bricks are labelled 0..K-1, and the sentinel label K marks pixels
+        # without bricks: per-game brick arrays have K+1 columns, the last of
+        # which is never alive.
+        bricks = template.bricks
+        num_bricks = len(bricks)
+
+        self.num_bricks = num_bricks
+        self.brick_labels = np.full(shape, num_bricks, dtype=int)
+        self.brick_colors = np.zeros((num_bricks + 1, 3), dtype=np.uint8)
+        self.brick_rewards = np.zeros(num_bricks + 1)
+        self.brick_hitpoints = np.zeros(num_bricks + 1, dtype=int)
+        self.brick_bottoms = np.full(num_bricks + 1, self.height, dtype=int)
+        self.is_accelerator = np.zeros(num_bricks + 1, dtype=bool)
+
+        for k, brick in enumerate(bricks):
+            if type(brick) not in (Brick, AcceleratorBrick):
+                raise NotImplementedError(
+                    "Unsupported brick: {}".format(type(brick)))
+
+            xs, ys = np.array(brick.offset_nzis).T
+            self.brick_labels[xs, ys] = k
+            self.brick_colors[k] = brick.color
+            self.brick_rewards[k] = brick.reward
+            self.brick_hitpoints[k] = brick.hitpoints
+            self.brick_bottoms[k] = brick.position[1] + brick.nzis_min[1]
+            self.is_accelerator[k] = isinstance(brick, AcceleratorBrick)
+
+    def _setup_paddle(self, template):
+        """
+        Paddle shape, vertical position, horizontal domain and colors.
+        """
+        paddle = template.paddle
+
+        self.paddle_width, self.paddle_height = paddle.shape
+        self.paddle_color = np.array(paddle.color, dtype=np.uint8)
+        self.ball_color = np.array(template.balls[0].color, dtype=np.uint8)
+        self.paddle_starting_x = template.paddle_starting_position[0]
+        self.paddle_y = paddle.position[1]
+        self.paddle_domain = template.accessible_domain
+
+        self.paddle_speed = template.paddle_speed
+        self.paddle_speed_cdf = np.cumsum(template.paddle_speed_distribution)
+
+    def _setup_physics_tables(self, template):
+        """
+        Velocity tables, same-quadrant velocity candidates used to randomize
+        bounces, downward velocities and paddle response functions for each
+        ball movement radius.
+        """
+        R = _MAX_SPEED
+        radii = range(1, R + 1)
+        saved_radius = template.ball_movement_radius
+
+        tables = {}
+        prfs = {}
+        for r in radii:
+            template.ball_movement_radius = r
+            tables[r] = [template.index_to_velocity[i]
+                         for i in range(len(template.index_to_velocity))]
+            prfs[r] = template.get_paddle_response_function()
+
+        template.ball_movement_radius = saved_radius
+
+        M = max(len(table) for table in tables.values())
+
+        self.velocities = np.zeros((R + 1, M, 2), dtype=int)
+        self.velocity_index = np.full((R + 1, 2 * R + 1, 2 * R + 1), -1,
+                                      dtype=int)
+        self.candidates = np.zeros((R + 1, M, M), dtype=int)
+        self.num_candidates = np.ones((R + 1, M), dtype=int)
+        self.downward = np.zeros((R + 1, M), dtype=int)
+        self.num_downward = np.ones(R + 1, dtype=int)
+        self.prf = np.zeros((R + 1, self.paddle_width), dtype=int)
+
+        for r in radii:
+            table = tables[r]
+            signs = np.sign(table)
+
+            for i, (vx, vy) in enumerate(table):
+                self.velocities[r, i] = vx, vy
+                self.velocity_index[r, vx + R, vy + R] = i
+
+                if template.allow_bounce_against_physics:
+                    same_quadrant = range(len(table))
+                else:
+                    same_quadrant = [j for j in range(len(table))
+                                     if (signs[j] == signs[i]).all()]
+                self.candidates[r, i, :len(same_quadrant)] = same_quadrant
+                self.num_candidates[r, i] = len(same_quadrant)
+
+            downward = [i for i, (_, vy) in enumerate(table) if vy < 0]
+            self.downward[r, :len(downward)] = downward
+            self.num_downward[r] = len(downward)
+            self.prf[r] = prfs[r]
+
+    def _setup_events(self, template):
+        """
+        Ball acceleration events, specified by their brick hit counts.
+        """
+        for event in template.conditional_events:
+            if not isinstance(event, BallAcceleratesEvent):
+                raise NotImplementedError(
+                    "Unsupported event: {}".format(type(event)))
+
+        self.acceleration_hits = np.array(
+            [event.brick_hits for event in template.conditional_events],
+            dtype=int)
+
+        # Like the events of BreakoutEngine, kept across episodes and resets
+        self.events_triggered = np.zeros(
+            (self.num_envs, len(self.acceleration_hits)), dtype=bool)
+
+    def _setup_rendering(self):
+        """
+        Frames of the background (walls only) and of the full layout (walls
+        and all the bricks), in the (row, column) orientation of the images.
+        """
+        layout_image = self.static_image.copy()
+        labels = self.brick_labels
+        has_brick = labels < self.num_bricks
+        layout_image[has_brick] = self.brick_colors[labels[has_brick]]
+
+        self.background_frame = self._to_frame(self.static_image)
+        self.layout_frame = self._to_frame(layout_image)
+
+        # Pixels of each brick, to erase it from a frame upon destruction
+        self.brick_pixels = []
+        for k in range(self.num_bricks):
+            xs, ys = (labels == k).nonzero()
+            self.brick_pixels.append((self.height - 1 - ys, xs))
+
+    ###########################################################################
+    # API methods
+    ###########################################################################
+
+    def reset(self):
+        """
+        Reset all the games of the batch.
+
+        Returns
+        -------
+        images : numpy.ndarray[:, :, :, :] (dtype=numpy.uint8)
+            Batch of images shaped (N, height, width, 3), or None if the
+            games are not rendered.
+        """
+        N, B, K = self.num_envs, self.num_balls, self.num_bricks
+
+        self.ball_x = np.zeros((N, B), dtype=int)
+        self.ball_y = np.zeros((N, B), dtype=int)
+        self.ball_velocity_index = np.zeros((N, B), dtype=int)
+        self.ball_alive = np.zeros((N, B), dtype=bool)
+        self.paddle_x = np.zeros(N, dtype=int)
+        self.brick_alive = np.zeros((N, K + 1), dtype=bool)
+        self.hitpoints = np.zeros((N, K + 1), dtype=int)
+        self.radius = np.zeros(N, dtype=int)
+        self.num_lives = np.zeros(N)
+        self.brick_hit_counter = np.zeros(N, dtype=int)
+        self.accelerator_triggers = np.zeros(N, dtype=int)
+        self.current_episode_frame = np.zeros(N, dtype=int)
+
+        if self.render_images:
+            self.frames = np.empty((N, self.height, self.width, 3),
+                                   dtype=np.uint8)
+            self._drawn_pixels = (np.array([], dtype=int),) * 3
+
+        self._reset_envs(np.ones(N, dtype=bool))
+        self._draw_moving_objects()
+        self.reset_has_never_been_called = False
+
+        return self.get_images()
+
+    def step(self, actions):
+        """
+        Advance all the games of the batch by one timestep.
+
+        Parameters
+        ----------
+        actions : numpy.ndarray([int])
+            One action per game.
+
+        Returns
+        -------
+        images : numpy.ndarray[:, :, :, :] (dtype=numpy.uint8) or None
+            Batch of images shaped (N, height, width, 3).
+        rewards : numpy.ndarray([float])
+            Reward of each game, clipped to [-1, 1].
+        dones : numpy.ndarray([bool])
+            Whether each game has reached a termination state. Those games
+            have been reset already.
+        debug_info : dict
+            Number of lives of each game before the automatic resets.
+        """
+        if self.reset_has_never_been_called:
+            raise ResetHasNeverBeenCalledError
+
+        actions = np.asarray(actions)
+        if actions.shape != (self.num_envs,) or \
+           not np.in1d(actions, self.ACTIONS).all():
+            raise ValueError("Invalid actions: {}".format(actions))
+
+        self.rewards = np.zeros(self.num_envs)
+        self.hits = np.zeros_like(self.brick_alive)
+
+        # Same phases as BreakoutEngine._step
+        self._resolve_ball_physics()
+        self._resolve_collisions()
+        self._update_paddle_positions(actions)
+        self._resolve_conditional_events()
+
+        self.current_episode_frame += 1
+        dones = self._end_game_manager()
+        rewards = np.clip(self.rewards, -1, 1)
+        debug_info = {'num_lives': self.num_lives.copy()}
+
+        if dones.any():
+            self._reset_envs(dones)
+
+        self._draw_moving_objects()
+
+        return self.get_images(), rewards, dones, debug_info
+
+    def get_images(self):
+        """
+        Images of all the games of the batch.
+
+        Returns
+        -------
+        images : numpy.ndarray[:, :, :, :] (dtype=numpy.uint8) or None
+            Batch of RGB images shaped (N, height, width, 3), rendered the
+            same way as BreakoutEngine._get_image, or None if the games are
+            not rendered.
+        """
+        if not self.render_images:
+            return None
+
+        return self.frames.copy()
+
+    ###########################################################################
+    # Game dynamics
+    ###########################################################################
+
+    def _resolve_ball_physics(self):
+        """
+        Batched version of BreakoutEngine._resolve_ball_physics, applied to
+        all the balls in play at once. Balls do not interact with each other
+        and objects do not move during this phase, so balls are independent.
+
+        Mutates
+        -------
+        self.ball_x, self.ball_y, self.ball_velocity_index
+        self.hits : numpy.ndarray[:, :] (dtype=bool)
+            Bricks hit by the balls during the time step.
+        """
+        env = self._ball_env
+        active = self.ball_alive.ravel()
+
+        bx = self.ball_x.ravel()
+        by = self.ball_y.ravel()
+        idx = self.ball_velocity_index.ravel()
+        r = self.radius[env]
+        vx = self.velocities[r, idx, 0]
+        vy = self.velocities[r, idx, 1]
+
+        # Balls starting in the paddle travel in a straight line
+        inside = active & self._in_paddle(env, bx, by)
+        direct = active & ~inside
+
+        # Paddle bounce: horizontal velocity given by the PRF
+        on_paddle = direct & self._in_paddle(env, bx + vx, by + vy)
+        paddle_x = self.paddle_x[env]
+        impact_x = np.clip(bx, paddle_x, paddle_x + self.paddle_width - 1)
+        vx_after_paddle_bounce = self.prf[r, impact_x - paddle_x]
+
+        # Direct collisions with bricks
+        labels = self._brick_labels_at(env, bx + vx, by + vy)
+        self.hits[env[direct], labels[direct]] = True
+
+        occupied = self._is_occupied(env, bx + vx, by + vy)
+        occupied_x = self._is_occupied(env, bx + vx, by)
+        occupied_y = self._is_occupied(env, bx, by + vy)
+
+        bounce = direct & occupied & ~on_paddle
+        bounce_x = bounce & occupied_x
+        bounce_y = bounce & ~occupied_x & occupied_y
+        reverse = bounce & ~occupied_x & ~occupied_y
+
+        new_vx = vx.copy()
+        new_vy = vy.copy()
+
+        # [Bounce, paddle]
+        pvx = vx_after_paddle_bounce
+        pvy = -vy
+        slow = (np.abs(pvy) < r) & (np.abs(pvx) <= 1)
+        pvy = np.where(slow, r, pvy)
+        pvx = np.where(self._is_occupied(env, bx + pvx, by + pvy), -pvx, pvx)
+        new_vx[on_paddle] = pvx[on_paddle]
+        new_vy[on_paddle] = pvy[on_paddle]
+
+        # [Bounce, brick or wall]
+        new_vx[bounce_x] *= -1
+        new_vy[bounce_y] *= -1
+
+        # [Reverse]
+        new_vx[reverse] *= -1
+        new_vy[reverse] *= -1
+
+        new_idx = idx.copy()
+        changed = on_paddle | bounce
+        new_idx[changed] = self._velocity_to_index(
+            r[changed], new_vx[changed], new_vy[changed])
+
+        randomized = bounce_x | bounce_y
+        new_idx[randomized] = self._randomize_velocity(
+            r[randomized], new_idx[randomized])
+
+        new_vx = self.velocities[r, new_idx, 0]
+        new_vy = self.velocities[r, new_idx, 1]
+
+        # Check where we landed, manage any higher-order collisions
+        landed = direct & self._is_occupied(env, bx + new_vx, by + new_vy)
+        new_vx[landed] = -vx[landed]
+        new_vy[landed] = -vy[landed]
+        new_idx[landed] = self._velocity_to_index(
+            r[landed], new_vx[landed], new_vy[landed])
+
+        shape = self.ball_alive.shape
+        self.ball_x = np.where(active, bx + new_vx, bx).reshape(shape)
+        self.ball_y = np.where(active, by + new_vy, by).reshape(shape)
+        self.ball_velocity_index = \
+            np.where(active, new_idx, idx).reshape(shape)
+
+    def _resolve_collisions(self):
+        """
+        Collision and destruction effects of the bricks hit during the time
+        step (see Brick and AcceleratorBrick).
+        """
+        hits = self.hits
+        hits[:, -1] = False
+
+        self.hitpoints -= hits
+
+        # Accelerator bricks
+        accelerations = np.minimum((hits & self.is_accelerator).sum(axis=1),
+                                   self.accelerator_triggers)
+        self.radius = np.minimum(self.radius + accelerations, _MAX_SPEED)
+        self.accelerator_triggers -= accelerations
+
+        # Destruction
+        destroyed = hits & (self.hitpoints == 0)
+        self.rewards += (destroyed * self.brick_rewards).sum(axis=1)
+        self.brick_hit_counter += destroyed.sum(axis=1)
+        self.brick_alive &= ~destroyed
+
+        if self.render_images:
+            for env, k in zip(*destroyed.nonzero()):
+                rows, columns = self.brick_pixels[k]
+                self.frames[env, rows, columns] = \
+                    self.background_frame[rows, columns]
+
+    def _update_paddle_positions(self, actions):
+        """
+        Batched version of BreakoutEngine.update_paddle_position.
+        """
+        draws = self.np_random.random_sample(self.num_envs)
+        speeds = np.searchsorted(self.paddle_speed_cdf, draws, side='right')
+        speeds = np.minimum(speeds, 2 * self.paddle_speed) - self.paddle_speed
+
+        direction = np.zeros(self.num_envs, dtype=int)
+        direction[actions == self.LEFT] = -1
+        direction[actions == self.RIGHT] = 1
+
+        self.paddle_x = np.clip(self.paddle_x + direction * speeds,
+                                self.paddle_domain[0], self.paddle_domain[1])
+
+    def _resolve_conditional_events(self):
+        """
+        Ball acceleration events (see BallAcceleratesEvent).
+        """
+        for e, brick_hits in enumerate(self.acceleration_hits):
+            happens = ((self.brick_hit_counter == brick_hits) &
+                       ~self.events_triggered[:, e])
+            self.radius[happens] = np.minimum(self.radius[happens] + 1,
+                                              _MAX_SPEED)
+            self.events_triggered[:, e] |= happens
+
+    def _end_game_manager(self):
+        """
+        Batched version of BreakoutEngine.end_game_manager.
+
+        Returns
+        -------
+        dones : numpy.ndarray([bool])
+        """
+        dones = np.zeros(self.num_envs, dtype=bool)
+
+        # Are there any bricks remaining?
+        if self.can_run_out_of_bricks:
+            good_bricks = self.brick_alive & (self.brick_rewards > 0)
+            won = ~good_bricks.any(axis=1)
+            self.rewards[won] += self.reward_upon_no_bricks_left
+            dones |= won
+
+        # Catch lost balls
+        lost = self.ball_alive & (self.ball_y <= 0)
+        self.ball_alive &= ~lost
+        self.rewards += lost.sum(axis=1) * self.reward_upon_ball_loss
+
+        # No balls left! Reset.
+        no_balls = ~self.ball_alive.any(axis=1)
+        if no_balls.any():
+            self.num_lives[no_balls] -= 1
+            self._randomize_ball_positions_and_velocities(no_balls)
+            dones[no_balls] = self.num_lives[no_balls] <= 0
+
+        return dones
+
+    def _reset_envs(self, mask):
+        """
+        Start a new episode for the games selected by a boolean mask.
+        """
+        self.brick_alive[mask, :-1] = True
+        self.hitpoints[mask] = self.brick_hitpoints
+        self.radius[mask] = self.starting_ball_movement_radius
+        self.num_lives[mask] = self.initial_num_lives
+        self.brick_hit_counter[mask] = 0
+        self.accelerator_triggers[mask] = _MAX_SPEED - 1
+        self.current_episode_frame[mask] = -1
+
+        if self.render_images:
+            self.frames[mask] = self.layout_frame
+
+        self._randomize_paddle_positions(mask)
+        self._randomize_ball_positions_and_velocities(mask)
+
+    def _randomize_paddle_positions(self, mask):
+        """
+        Batched version of BreakoutEngine.randomize_paddle_position.
+        """
+        if self.paddle_starting_x is not None:
+            self.paddle_x[mask] = self.paddle_starting_x
+        else:
+            self.paddle_x[mask] = self.np_random.randint(
+                self.paddle_domain[0], self.paddle_domain[1] + 1,
+                size=mask.sum())
+
+    def _randomize_ball_positions_and_velocities(self, mask):
+        """
+        Batched version of BreakoutEngine.randomize_ball_position_and_velocity
+        for the games selected by a boolean mask: all their balls are put back
+        in play.
+        """
+        envs = mask.nonzero()[0]
+        r = self.radius[envs]
+
+        # Downward velocities
+        for b in range(self.num_balls):
+            choice = (self.np_random.random_sample(len(envs)) *
+                      self.num_downward[r]).astype(int)
+            self.ball_velocity_index[envs, b] = self.downward[r, choice]
+
+        # Positions, under the lowest remaining brick
+        bottoms = np.where(self.brick_alive[envs], self.brick_bottoms,
+                           self.height)
+        maximum_ball_y = np.minimum(bottoms.min(axis=1),
+                                    self.height - 1 - self.wall_thickness)
+        offsets = np.arange(-self.num_balls - 1, self.num_balls + 2)
+
+        for b in range(self.num_balls):
+            pending = envs
+            while len(pending):
+                n = len(pending)
+                self.ball_x[pending, b] = (self.width // 2 +
+                                           self.np_random.choice(offsets, n))
+                self.ball_y[pending, b] = (
+                    maximum_ball_y[np.searchsorted(envs, pending)] // 2 -
+                    self.np_random.randint(_MAX_SPEED, size=n))
+
+                x = self.ball_x[pending, b]
+                y = self.ball_y[pending, b]
+                blocked = self._is_occupied(pending, x, y)
+
+                # Only the balls placed before this one are in their new
+                # positions
+                for other in range(b):
+                    blocked |= ((self.ball_x[pending, other] == x) &
+                                (self.ball_y[pending, other] == y))
+
+                pending = pending[blocked]
+
+            self.ball_alive[envs, b] = True
+
+    ###########################################################################
+    # Rendering
+    ###########################################################################
+
+    def _draw_moving_objects(self):
+        """
+        Incrementally update the frames: the paddles and balls drawn at the
+        previous timestep are erased, and redrawn at their new positions.
+        Bricks are erased from the frames as they get destroyed, so that the
+        cost of rendering does not depend on the size of the board.
+        """
+        if not self.render_images:
+            return
+
+        # Erase, restoring the layout underneath
+        envs, xs, ys = self._drawn_pixels
+        rows = self.height - 1 - ys
+        alive = self.brick_alive[envs, self.brick_labels[xs, ys]]
+        self.frames[envs, rows, xs] = np.where(
+            alive[:, np.newaxis],
+            self.layout_frame[rows, xs],
+            self.background_frame[rows, xs])
+
+        # Paddles
+        paddle_envs = np.repeat(np.arange(self.num_envs),
+                                self.paddle_width * self.paddle_height)
+        paddle_xs = (self.paddle_x[:, np.newaxis, np.newaxis] +
+                     np.arange(self.paddle_width)[:, np.newaxis] +
+                     np.zeros(self.paddle_height, dtype=int)).ravel()
+        paddle_ys = np.tile(self.paddle_y + np.arange(self.paddle_height),
+                            self.num_envs * self.paddle_width)
+        self.frames[paddle_envs, self.height - 1 - paddle_ys, paddle_xs] = \
+            self.paddle_color
+
+        # Balls (always last in order to always be visible)
+        ball_envs, balls = self.ball_alive.nonzero()
+        ball_xs = self.ball_x[ball_envs, balls]
+        ball_ys = self.ball_y[ball_envs, balls]
+        self.frames[ball_envs, self.height - 1 - ball_ys, ball_xs] = \
+            self.ball_color
+
+        self._drawn_pixels = (np.concatenate([paddle_envs, ball_envs]),
+                              np.concatenate([paddle_xs, ball_xs]),
+                              np.concatenate([paddle_ys, ball_ys]))
+
+    def _to_frame(self, image):
+        """
+        Convert an image from the native (x, y) orientation of the game to
+        the (row, column) orientation of the observations.
+        """
+        return np.ascontiguousarray(image[:, ::-1].transpose(1, 0, 2))
+
+    ###########################################################################
+    # Helper methods
+    ###########################################################################
+
+    def _in_paddle(self, env, x, y):
+        """
+        Whether positions (x, y) of games `env` are covered by the paddle.
+        """
+        paddle_x = self.paddle_x[env]
+        return ((x >= paddle_x) & (x < paddle_x + self.paddle_width) &
+                (y >= self.paddle_y) & (y < self.paddle_y + self.paddle_height))
+
+    def _brick_labels_at(self, env, x, y):
+        """
+        Label of the surviving brick at positions (x, y) of games `env`, or
+        the sentinel label if there is none.
+        """
+        inside = (x >= 0) & (x < self.width) & (y >= 0) & (y < self.height)
+        labels = self.brick_labels[np.clip(x, 0, self.width - 1),
+                                   np.clip(y, 0, self.height - 1)]
+        labels[~inside] = self.num_bricks
+        labels[~self.brick_alive[env, labels]] = self.num_bricks
+        return labels
+
+    def _is_occupied(self, env, x, y):
+        """
+        Whether positions (x, y) of games `env` are covered by a tangible
+        object, i.e. a wall, a surviving brick or the paddle.
+        """
+        inside = (x >= 0) & (x < self.width) & (y >= 0) & (y < self.height)
+        xc = np.clip(x, 0, self.width - 1)
+        yc = np.clip(y, 0, self.height - 1)
+
+        occupied = (self.static_occupancy[xc, yc] |
+                    self.brick_alive[env, self.brick_labels[xc, yc]] |
+                    self._in_paddle(env, x, y))
+
+        return occupied & inside
+
+    def _velocity_to_index(self, r, vx, vy):
+        """
+        Batched lookup of velocity indices, given ball movement radii.
+        """
+        index = self.velocity_index[r, vx + _MAX_SPEED, vy + _MAX_SPEED]
+
+        if (index < 0).any():
+            raise KeyError("Invalid ball velocity.")
+
+        return index
+
+    def _randomize_velocity(self, r, index):
+        """
+        Batched version of BreakoutEngine.randomize_velocity: with probability
+        `bounce_stochasticity`, draw a new velocity uniformly among the ones
+        in the same quadrant.
+        """
+        n = len(index)
+        deviate = self.np_random.random_sample(n) < self.bounce_stochasticity
+        choice = (self.np_random.random_sample(n) *
+                  self.num_candidates[r, index]).astype(int)
+
+        return np.where(deviate, self.candidates[r, index, choice], index)
@@ -1,5 +1,4 @@
 import numpy as np
-import matplotlib as mpl
 
 
 ###############################################################################
@@ -40,17 +39,19 @@ def compute_edge_nzis(nzis):
     Function that retrives the non-zero indices of a shape located on the
     border of that shape.
     """
-    edge_nzis = nzis[:]
+    nzis = [tuple(nzi) for nzi in nzis]
+    nzis_set = set(nzis)
+    edge_nzis = []
 
     for dx, dy in nzis:
-        inner_nzi = ((dx, dy + 1) in nzis and
-                     (dx, dy - 1) in nzis and
-                     (dx + 1, dy) in nzis and
-                     (dx - 1, dy) in nzis)
-        if inner_nzi:
-            edge_nzis.remove((dx, dy))
+        inner_nzi = ((dx, dy + 1) in nzis_set and
+                     (dx, dy - 1) in nzis_set and
+                     (dx + 1, dy) in nzis_set and
+                     (dx - 1, dy) in nzis_set)
+        if not inner_nzi:
+            edge_nzis.append((dx, dy))
 
-    return edge_nzis
+    return np.array(edge_nzis)
 
 
 def offset_nzis_from_position(nzis, pos):
@@ -61,13 +62,27 @@ def offset_nzis_from_position(nzis, pos):
 # Color utilities
 ###############################################################################
 
+# Palettes already computed by `get_distinct_colors`, indexed by size
+_memoized_distinct_colors = {}
+
+
 def get_distinct_colors(n):
     """
-    Get a palette of n distinct colors to use for the bricks
+    Get a palette of n distinct colors to use for the bricks. Palettes are
+    computed once per size, so that matplotlib is only called (and imported)
+    the first time.
     """
-    cmap = mpl.cm.Set3
-    bins = np.linspace(0, 1, 9)[:n]
-    pal = list(map(tuple, cmap(bins)[:, :3]))
-    pal = [(round(255*r), round(255*g), round(255*b)) for (r, g, b) in pal]
-
-    return pal
+    try:
+        pal = _memoized_distinct_colors[n]
+    except KeyError:
+        # Deferred, as matplotlib is slow to import and only needed here
+        from matplotlib import cm
+
+        cmap = cm.Set3
+        bins = np.linspace(0, 1, 9)[:n]
+        pal = list(map(tuple, cmap(bins)[:, :3]))
+        pal = tuple((round(255*r), round(255*g), round(255*b))
+                    for (r, g, b) in pal)
+        _memoized_distinct_colors[n] = pal
+
+    return list(pal)